@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+"""
+Local HTTP server standing in for the portals checked by the link checker.
+The path selects the behaviour:
+
+    /ok/...       200 after the configured latency
+    /missing/...  404
+    /slow/...     answers only after the given timeout
+    /loop/...     redirects to itself
+    /nohead/...   405 for HEAD, 200 for GET
+    /large/...    405 for HEAD, 200 with a large body for GET
+
+The server listens on all addresses, so 127.0.0.1, 127.0.0.2, ... act as
+separate hosts.
+
+    $ python benchmarks/http_standin.py [port]
+"""
+
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+
+import socket
+import sys
+import time
+
+
+BODY_CHUNK = 'x' * 64 * 1024
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_HEAD(self):
+        self.respond(send_body=False)
+
+    def do_GET(self):
+        self.respond(send_body=True)
+
+    def respond(self, send_body):
+        behaviour = self.path.lstrip('/').split('/', 1)[0]
+
+        if behaviour == 'ok':
+            time.sleep(self.server.latency)
+            self.send_empty(200)
+        elif behaviour == 'missing':
+            self.send_empty(404)
+        elif behaviour == 'slow':
+            time.sleep(self.server.slow)
+            self.send_empty(200)
+        elif behaviour == 'loop':
+            self.send_response(302)
+            self.send_header('Location', self.path)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+        elif behaviour in ('nohead', 'large') and not send_body:
+            self.send_empty(405)
+        elif behaviour == 'nohead':
+            self.send_empty(200)
+        elif behaviour == 'large':
+            self.send_large()
+        else:
+            self.send_empty(400)
+
+    def send_empty(self, code):
+        self.send_response(code)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def send_large(self):
+        chunks = self.server.large_size / len(BODY_CHUNK)
+        self.send_response(200)
+        self.send_header('Content-Length', str(chunks * len(BODY_CHUNK)))
+        self.end_headers()
+
+        for i in range(chunks):
+            self.wfile.write(BODY_CHUNK)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StandInServer(ThreadingMixIn, HTTPServer):
+
+    daemon_threads = True
+    request_queue_size = 1024
+    allow_reuse_address = True
+
+    def __init__(self, port, latency=0.0, slow=60.0,
+                 large_size=50 * 1024 * 1024):
+        HTTPServer.__init__(self, ('0.0.0.0', port), StandInHandler)
+        self.latency = latency
+        self.slow = slow
+        self.large_size = large_size
+
+    def handle_error(self, request, client_address):
+        # The link checker closes connections early, e.g. for /large
+        if not isinstance(sys.exc_info()[1], socket.error):
+            HTTPServer.handle_error(self, request, client_address)
+
+
+def main():
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8765
+    StandInServer(port).serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+"""
+Compares the CPU time per package of the import stage before and after the
+import pipeline, on the Moers fixture scaled to the given number of
+packages. Before, the portal harvester and GroupCKANHarvester both parsed,
+amended and serialized the package before the CKAN harvester parsed it a
+third time. The pipeline parses and amends it once and serializes it once.
+Link checks and database writes are left out.
+
+    $ python benchmarks/import_stage.py [num_packages]
+"""
+
+from ckanext.govdatade.harvesters.ckanharvester import MoersCKANHarvester
+
+import copy
+import json
+import os
+import sys
+import time
+
+
+FIXTURE = os.path.join(os.path.dirname(__file__), '..', 'ckanext',
+                       'govdatade', 'tests', 'moers.json')
+
+
+def build_contents(num_packages):
+    package = json.load(open(FIXTURE))
+
+    contents = []
+    for i in range(num_packages):
+        scaled = copy.deepcopy(package)
+        scaled['name'] = '%s_%s' % (package['name'], i)
+        scaled['title'] = '%s %s' % (package['title'], i)
+        contents.append(json.dumps(scaled))
+    return contents
+
+
+def chained(harvester, content):
+    for i in range(2):
+        package = json.loads(content)
+        harvester.amend_package(package)
+        content = json.dumps(package)
+    return json.loads(content)
+
+
+def pipeline(harvester, content):
+    package = json.loads(content)
+    harvester.amend_package(package)
+    return json.loads(json.dumps(package))
+
+
+def measure(label, function, harvester, contents):
+    start = time.clock()
+    for content in contents:
+        function(harvester, content)
+    duration = time.clock() - start
+    print '%-30s %8.1f us/package' % (label,
+                                      duration / len(contents) * 10 ** 6)
+    return duration
+
+
+def main():
+    num_packages = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+
+    harvester = MoersCKANHarvester()
+    contents = build_contents(num_packages)
+
+    print '%s packages' % num_packages
+    before = measure('chained import stages', chained, harvester, contents)
+    after = measure('import pipeline', pipeline, harvester, contents)
+    print 'CPU time saved: %.0f%%' % ((1 - after / before) * 100)
+
+
+if __name__ == '__main__':
+    main()
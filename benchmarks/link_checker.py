@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+"""
+Measures the link checker throughput on synthetic catalogs against the local
+HTTP stand-in (http_standin.py). Reports URLs per second, the peak memory of
+the checking process and the number of Redis round trips. Requires a Redis
+server on localhost, the test database (1) is flushed.
+
+    $ python benchmarks/link_checker.py [options] [num_urls ...]
+
+Every catalog size runs in a fresh process, so that peak memory is measured
+per size. The host delay defaults to 0, as it limits the throughput to
+hosts / delay URLs per second regardless of the checker.
+"""
+
+from ckanext.govdatade.validators.link_checker import LinkChecker
+from ckanext.govdatade.validators.redis_pool import get_redis_client
+from http_standin import StandInServer
+from multiprocessing import Process, Queue
+from optparse import OptionParser
+
+import redis.connection
+import resource
+import threading
+import time
+
+
+# Share of the URLs per stand-in behaviour
+MIX = [('ok',      0.84),
+       ('missing', 0.05),
+       ('nohead',  0.04),
+       ('large',   0.03),
+       ('loop',    0.03),
+       ('slow',    0.01)]
+
+URLS_PER_DATASET = 5
+
+
+def build_catalog(num_urls, num_hosts, port):
+    kinds = []
+    for kind, share in MIX:
+        kinds.extend([kind] * int(round(share * 100)))
+
+    datasets = []
+    for i in range(0, num_urls, URLS_PER_DATASET):
+        resources = []
+        for j in range(i, min(i + URLS_PER_DATASET, num_urls)):
+            host_number = j % num_hosts
+            host = '127.0.%s.%s' % (host_number / 254, host_number % 254 + 1)
+            kind = kinds[j % len(kinds)]
+            url = 'http://%s:%s/%s/%s' % (host, port, kind, j)
+            resources.append({'url': url})
+
+        datasets.append({'id':        'dataset-%s' % i,
+                         'name':      'example-%s' % i,
+                         'extras':    {'metadata_original_portal': None},
+                         'resources': resources})
+    return datasets
+
+
+class RoundTripCounter(object):
+    """Counts the commands and pipelines sent to Redis, each one is a round
+    trip."""
+
+    def __init__(self):
+        self.count = 0
+        self.lock = threading.Lock()
+        self.send = redis.connection.Connection.send_packed_command
+
+    def install(self):
+        counter = self
+
+        def send_packed_command(connection, command):
+            with counter.lock:
+                counter.count += 1
+            return counter.send(connection, command)
+
+        redis.connection.Connection.send_packed_command = send_packed_command
+
+
+def run_catalog(num_urls, options, results):
+    get_redis_client('test').flushdb()
+
+    checker = LinkChecker(db='test', workers=options.workers)
+    checker.TIMEOUT = options.timeout
+    checker.scheduler.delay = options.host_delay
+    datasets = build_catalog(num_urls, options.hosts, options.port)
+
+    counter = RoundTripCounter()
+    counter.install()
+
+    start = time.time()
+    for i in range(0, len(datasets), options.batch):
+        checker.process_records(datasets[i:i + options.batch])
+    duration = time.time() - start
+    checker.close()
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    results.put((num_urls, duration, peak, counter.count))
+
+
+def serve(options):
+    server = StandInServer(options.port, latency=options.latency,
+                           slow=options.timeout * 2)
+    server.serve_forever()
+
+
+def main():
+    parser = OptionParser(usage='%prog [options] [num_urls ...]')
+    parser.add_option('--workers', type='int', default=10)
+    parser.add_option('--hosts', type='int', default=100)
+    parser.add_option('--host-delay', type='float', default=0.0)
+    parser.add_option('--latency', type='float', default=0.01,
+                      help='response time of the stand-in in seconds')
+    parser.add_option('--timeout', type='float', default=1.0,
+                      help='request timeout of the checker in seconds')
+    parser.add_option('--batch', type='int', default=200,
+                      help='datasets per process_records call')
+    parser.add_option('--port', type='int', default=8765)
+    options, args = parser.parse_args()
+
+    sizes = [int(arg) for arg in args] or [1000, 10000, 100000]
+
+    server = Process(target=serve, args=(options,))
+    server.daemon = True
+    server.start()
+    time.sleep(0.5)
+
+    print '%s workers, %s hosts, %.3fs latency, %.1fs timeout' % \
+        (options.workers, options.hosts, options.latency, options.timeout)
+    print '%10s %10s %10s %12s %12s' % ('URLs', 'seconds', 'URLs/s',
+                                        'peak KiB', 'round trips')
+
+    try:
+        for num_urls in sizes:
+            results = Queue()
+            process = Process(target=run_catalog,
+                              args=(num_urls, options, results))
+            process.start()
+            num_urls, duration, peak, round_trips = results.get()
+            process.join()
+
+            print '%10s %10.1f %10.1f %12s %12s' % \
+                (num_urls, duration, num_urls / duration, peak, round_trips)
+    finally:
+        server.terminate()
+        get_redis_client('test').flushdb()
+
+
+if __name__ == '__main__':
+    main()
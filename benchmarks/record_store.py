@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+"""
+Compares the per record cost of the legacy repr/eval storage format with the
+record hashes of the RecordStore. Requires a Redis server on localhost, the
+test database (1) is flushed.
+
+    $ python benchmarks/record_store.py [num_records] [urls_per_record]
+"""
+
+from ckanext.govdatade.validators.record_store import RecordStore
+
+import redis
+import sys
+import time
+
+
+def build_record(i, num_urls):
+    urls = {}
+    for j in range(num_urls):
+        url = 'http://daten.example.com/dataset/%s/resource/%s' % (i, j)
+        urls[url] = {'status': 404, 'date': '2014-01-01', 'strikes': 1}
+
+    return {'id': 'dataset-%s' % i,
+            'name': 'example-%s' % i,
+            'metadata_original_portal': 'http://daten.example.com',
+            'urls': urls}
+
+
+def measure(label, function, records):
+    start = time.time()
+    for record in records:
+        function(record)
+    duration = time.time() - start
+    print '%-30s %8.1f us/record' % (label, duration / len(records) * 10 ** 6)
+
+
+def legacy_write(redis_client, record):
+    redis_client.set(record['id'], record)
+
+
+def legacy_strike(redis_client, record):
+    stored = eval(unicode(redis_client.get(record['id'])))
+    url = sorted(stored['urls'])[0]
+    stored['urls'][url]['strikes'] += 1
+    stored['urls'][url]['date'] = '2014-01-02'
+    redis_client.set(record['id'], stored)
+
+
+def legacy_read(redis_client, record):
+    eval(redis_client.get(record['id']))
+
+
+def store_write(store, record):
+    batch = store.batch(100)
+    for url, entry in record['urls'].iteritems():
+        batch.set_url(record['id'], url, entry['status'], entry['date'],
+                      entry['strikes'])
+    batch.set_meta(record['id'], id=record['id'], name=record['name'],
+                   metadata_original_portal=record['metadata_original_portal'])
+    batch.flush()
+
+
+def store_strike(store, record):
+    url = sorted(record['urls'])[0]
+    batch = store.batch(100)
+    batch.load([record['id']])
+    batch.add_strike(record['id'], url, '2014-01-02')
+    batch.flush()
+
+
+def store_read(store, record):
+    store.get(record['id'])
+
+
+def main():
+    num_records = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    num_urls = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    redis_client = redis.StrictRedis(db=1)
+    store = RecordStore(redis_client)
+    records = [build_record(i, num_urls) for i in range(num_records)]
+
+    print '%s records with %s URLs each' % (num_records, num_urls)
+
+    redis_client.flushdb()
+    measure('legacy write', lambda r: legacy_write(redis_client, r), records)
+    measure('legacy strike update',
+            lambda r: legacy_strike(redis_client, r), records)
+    measure('legacy read', lambda r: legacy_read(redis_client, r), records)
+
+    redis_client.flushdb()
+    measure('hash write', lambda r: store_write(store, r), records)
+    measure('hash strike update', lambda r: store_strike(store, r), records)
+    measure('hash read', lambda r: store_read(store, r), records)
+
+    redis_client.flushdb()
+
+
+if __name__ == '__main__':
+    main()
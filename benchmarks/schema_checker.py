@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+"""
+Compares the per dataset cost of validating against the OGPD schema with a
+new validator for each of three passes (iter_errors, is_valid, iter_errors)
+against a shared validator and a single pass. Half of the datasets are
+invalid. The schema is taken from the registry unless a local copy is given.
+
+    $ python benchmarks/schema_checker.py [num_datasets] [schema.json]
+"""
+
+from ckanext.govdatade.registry import get_schema
+from ckanext.govdatade.validators.schema_checker import broken_rules
+from ckanext.govdatade.validators.schema_checker import schema_validator
+from jsonschema.validators import Draft3Validator
+
+import json
+import sys
+import time
+
+
+def build_dataset(i):
+    dataset = {'id':         'dataset-%s' % i,
+               'name':       'statistiken-%s' % i,
+               'author':     'Eric Walter',
+               'notes':      'Statistiken von %s.' % i,
+               'title':      'Statistiken %s' % i,
+               'resources':  [{'url':    'http://www.example.com/%s.csv' % i,
+                               'format': 'CSV'}],
+               'groups':     ['verwaltung'],
+               'tags':       ['statistik'],
+               'license_id': 'cc-zero',
+               'type':       'datensatz',
+               'extras':     {'dates': [{'role': 'veroeffentlicht',
+                                         'date': '2013-01-01'}]}}
+
+    # Every second dataset breaks a few rules
+    if i % 2:
+        dataset['type'] = 'unknown'
+        dataset['extras']['dates'] = 'yesterday'
+        del dataset['license_id']
+
+    return dataset
+
+
+def measure(label, function, datasets):
+    start = time.time()
+    for dataset in datasets:
+        function(dataset)
+    duration = time.time() - start
+    print '%-30s %8.1f us/dataset' % (label,
+                                      duration / len(datasets) * 10 ** 6)
+
+
+def three_passes(schema, dataset):
+    errors = Draft3Validator(schema).iter_errors(dataset)
+    if not Draft3Validator(schema).is_valid(dataset):
+        errors = Draft3Validator(schema).iter_errors(dataset)
+        [[error.path, error.message] for error in errors]
+
+
+def main():
+    num_datasets = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+
+    if len(sys.argv) > 2:
+        schema = json.load(open(sys.argv[2]))
+    else:
+        schema = get_schema()
+
+    datasets = [build_dataset(i) for i in range(num_datasets)]
+
+    print '%s datasets' % num_datasets
+    measure('three passes', lambda d: three_passes(schema, d), datasets)
+
+    validator = schema_validator(schema)
+    measure('single pass', lambda d: broken_rules(validator, d), datasets)
+
+
+if __name__ == '__main__':
+    main()
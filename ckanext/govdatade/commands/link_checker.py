@@ -1,22 +1,44 @@
 #!/usr/bin/env python
 # -*- coding: utf8 -*-
 
+from ckan import model
 from ckan.lib.cli import CkanCommand
+from ckan.logic.schema import default_package_schema
+from ckan.logic import get_action, NotFound
 from ckanext.govdatade import CONFIG
+from ckanext.govdatade.harvesters.fingerprints import FingerprintStore
+from ckanext.govdatade.util import iterate_local_datasets
 from ckanext.govdatade.util import iterate_remote_datasets
 from ckanext.govdatade.util import generate_link_checker_data
+from ckanext.govdatade.util import normalize_action_dataset
 from ckanext.govdatade.validators import link_checker
+from ckanext.govdatade.validators.record_store import migrate_records
+from ckanext.govdatade.validators.redis_pool import get_redis_client
 from collections import defaultdict
 from jinja2 import Environment, FileSystemLoader
 
 import os
 import requests
+import time
 
 
 class LinkChecker(CkanCommand):
-    '''Checks the availability of the dataset's URLs'''
+    '''Checks the availability of the dataset's URLs
+
+    Usage:
+        linkchecker remote <endpoint>  - check all URLs of a remote CKAN
+        linkchecker run [limit]        - check the URLs which are due and
+                                         delete datasets with 3 strikes
+        linkchecker produce            - queue all local datasets for the
+                                         workers
+        linkchecker worker [batch]     - check queued datasets until the
+                                         queue is empty
+        linkchecker report             - generate the link checker report
+        linkchecker migrate            - convert records of older versions
+    '''
 
     summary = __doc__.split('\n')[0]
+    usage = __doc__
 
     def __init__(self, name):
         super(LinkChecker, self).__init__(name)
@@ -26,20 +48,153 @@ class LinkChecker(CkanCommand):
 
         num_urls = 0
         num_success = 0
-        for i, dataset in enumerate(iterate_remote_datasets(endpoint)):
-            print 'Process %s' % i
-            for resource in dataset['resources']:
-                num_urls += 1
-                url = resource['url'].encode('utf-8')
-                response_code = checker.validate(url)
-                print response_code
+        try:
+            for i, dataset in enumerate(iterate_remote_datasets(endpoint)):
+                print 'Process %s' % i
+                urls = [resource['url'].encode('utf-8')
+                        for resource in dataset['resources']]
 
-                if checker.is_available(response_code):
-                    num_success += 1
+                for response_code in checker.map(checker.check_url, urls):
+                    num_urls += 1
+                    print response_code
+
+                    if checker.working(response_code):
+                        num_success += 1
+        finally:
+            checker.close()
 
         print num_urls
         print num_success
 
+    def check_due(self, limit):
+        super(LinkChecker, self)._load_config()
+        context = {'model':       model,
+                   'session':     model.Session,
+                   'ignore_auth': True}
+
+        package_show = get_action('package_show')
+        checker = link_checker.LinkChecker()
+
+        due = defaultdict(list)
+        for dataset_id, url in checker.schedule.next_due(time.time(), limit):
+            due[dataset_id].append(url)
+
+        datasets = []
+        for dataset_id, urls in due.iteritems():
+            try:
+                dataset = package_show(context, {'id': dataset_id})
+            except NotFound:
+                dataset = {'resources': []}
+
+            # Forget URLs of deleted datasets and removed resources
+            current = [resource['url'] for resource in dataset['resources']]
+            checker.schedule.remove([(dataset_id, url) for url in urls
+                                     if url not in current])
+
+            if current:
+                normalize_action_dataset(dataset)
+                datasets.append(dataset)
+
+        try:
+            deletes = checker.process_records(datasets)
+        finally:
+            checker.close()
+
+        num_deleted = self.delete_datasets(datasets, deletes)
+
+        print 'Checked %s datasets' % len(datasets)
+        print 'Deleted %s datasets with 3 strikes' % num_deleted
+
+    def produce(self, chunk_size=500):
+        super(LinkChecker, self)._load_config()
+        context = {'model':       model,
+                   'session':     model.Session,
+                   'ignore_auth': True}
+
+        checker = link_checker.LinkChecker()
+
+        num_datasets = 0
+        datasets = []
+        for dataset in iterate_local_datasets(context):
+            normalize_action_dataset(dataset)
+            datasets.append(dataset)
+
+            if len(datasets) == chunk_size:
+                checker.queue.push_many(datasets)
+                num_datasets += len(datasets)
+                datasets = []
+
+        checker.queue.push_many(datasets)
+        num_datasets += len(datasets)
+
+        print 'Queued %s datasets' % num_datasets
+
+    def delete_datasets(self, datasets, deletes):
+        """Deletes the datasets with a URL that has 3 strikes. Returns the
+        number of deleted datasets. Their imports are forgotten, so that the
+        harvesters activate them again once their URLs work."""
+
+        context = {'model':       model,
+                   'session':     model.Session,
+                   'user':        u'harvest',
+                   'schema':      default_package_schema(),
+                   'validate':    False,
+                   'api_version': 1}
+
+        package_show = get_action('package_show')
+        package_update = get_action('package_update')
+
+        num_deleted = 0
+        for dataset, delete in zip(datasets, deletes):
+            if not delete:
+                continue
+
+            try:
+                package = package_show(context, {'id': dataset['id']})
+            except NotFound:
+                continue
+
+            if package['state'] != 'deleted':
+                package['state'] = 'deleted'
+                package_update(context, package)
+                FingerprintStore.forget(get_redis_client(), package['id'])
+                num_deleted += 1
+
+        return num_deleted
+
+    def work_queue(self, batch_size):
+        super(LinkChecker, self)._load_config()
+        checker = link_checker.LinkChecker()
+
+        num_datasets = 0
+        num_deleted = 0
+        try:
+            while True:
+                items = checker.queue.claim(batch_size, block=5)
+                if not items:
+                    break
+
+                datasets = [dataset for message_id, dataset in items]
+                deletes = checker.process_records(datasets)
+                num_datasets += len(datasets)
+                num_deleted += self.delete_datasets(datasets, deletes)
+
+                # Items of a worker dying before this point are claimed again
+                checker.queue.ack([message_id for message_id, dataset in items])
+        finally:
+            checker.close()
+
+        print 'Checked %s datasets' % num_datasets
+        print 'Deleted %s datasets with 3 strikes' % num_deleted
+
+    def migrate(self):
+        checker = link_checker.LinkChecker()
+        migrated, failed = migrate_records(checker.redis_client)
+
+        print 'Migrated %s records' % migrated
+        for key in failed:
+            print 'Unable to migrate %s' % key
+
     def generate_report(self):
         data = {}
         generate_link_checker_data(data)
@@ -73,3 +228,13 @@ class LinkChecker(CkanCommand):
                 self.check_remote_host(self.args[1])
             elif subcommand == 'report':
                 self.generate_report()
+            elif subcommand == 'migrate':
+                self.migrate()
+            elif subcommand == 'run':
+                limit = int(self.args[1]) if len(self.args) > 1 else 1000
+                self.check_due(limit)
+            elif subcommand == 'produce':
+                self.produce()
+            elif subcommand == 'worker':
+                batch = int(self.args[1]) if len(self.args) > 1 else 100
+                self.work_queue(batch)
@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+
+from ckan.lib.cli import CkanCommand
+from ckanext.govdatade.registry import RegistryError
+from ckanext.govdatade.registry import documents
+from ckanext.govdatade.registry import get_registry
+from paste.script.command import Command
+
+
+class Registry(CkanCommand):
+    '''Fetches the schema and category mappings into the local registry
+
+    Usage:
+        registry refresh [--force]  - fetch documents whose refresh interval
+                                      has passed, all documents with --force
+    '''
+
+    summary = __doc__.split('\n')[0]
+    usage = __doc__
+
+    parser = Command.standard_parser(verbose=True)
+    parser.add_option('-c', '--config', dest='config',
+                      default='development.ini', help='Config file to use.')
+    parser.add_option('--force', dest='force', action='store_true',
+                      default=False, help='Revalidate all documents.')
+
+    def __init__(self, name):
+        super(Registry, self).__init__(name)
+
+    def refresh(self):
+        registry = get_registry()
+
+        failed = 0
+        for name, url in documents():
+            try:
+                registry.refresh(name, url, self.options.force)
+                print 'Refreshed %s' % name
+            except RegistryError as e:
+                print e
+                failed += 1
+
+        return failed
+
+    def command(self):
+        if len(self.args) > 0 and self.args[0] == 'refresh':
+            if self.refresh():
+                raise SystemExit(1)
+        else:
+            print self.usage
@@ -4,28 +4,78 @@
 from ckan import model
 from ckan.model import Session
 from ckan.lib.cli import CkanCommand
+from paste.script.command import Command
 from ckan.logic.schema import default_package_schema
 
 from ckanext.govdatade import CONFIG
+from ckanext.govdatade.registry import get_schema
+from ckanext.govdatade.util import chunks
 from ckanext.govdatade.util import normalize_action_dataset
 from ckanext.govdatade.util import iterate_local_datasets
 from ckanext.govdatade.validators import schema_checker
 
 from collections import defaultdict
 from jinja2 import Environment, FileSystemLoader
-from jsonschema.validators import Draft3Validator
 from math import ceil
+from multiprocessing import Pool
 
 import ckanclient
 import os
 
 
+_validator = None
+
+
+def init_worker(schema):
+    global _validator
+    _validator = schema_checker.schema_validator(schema)
+
+
+def validate_chunk(task):
+    """Normalizes and validates the datasets in a worker process, skipping
+    datasets whose fingerprint matches the known one. Returns (dataset id,
+    portal, fingerprint, broken rules) per dataset, the broken rules are
+    None for skipped datasets."""
+
+    datasets, known = task
+
+    results = []
+    for dataset in datasets:
+        normalize_action_dataset(dataset)
+        portal = dataset['extras'].get('metadata_original_portal', 'null')
+        fingerprint = schema_checker.dataset_fingerprint(dataset)
+
+        rules = None
+        if known.get(dataset['id']) != fingerprint:
+            rules = schema_checker.broken_rules(_validator, dataset)
+        results.append((dataset['id'], portal, fingerprint, rules))
+
+    return results
+
+
 class SchemaChecker(CkanCommand):
-    '''Validates datasets against the GovData.de JSON schema'''
+    '''Validates datasets against the GovData.de JSON schema
+
+    Usage:
+        schemachecker [--workers N] [--full]
+                                         - check the local datasets with N
+                                           processes, --full also checks
+                                           unchanged datasets
+        schemachecker remote <endpoint>  - check the datasets of a remote CKAN
+    '''
 
     summary = __doc__.split('\n')[0]
+    usage = __doc__
+
+    CHUNK_SIZE = 100
 
-    SCHEMA_URL = 'https://raw.github.com/fraunhoferfokus/ogd-metadata/master/OGPD_JSON_Schema.json'  # NOQA
+    parser = Command.standard_parser(verbose=True)
+    parser.add_option('-c', '--config', dest='config',
+                      default='development.ini', help='Config file to use.')
+    parser.add_option('--workers', dest='workers', type='int', default=1,
+                      help='Number of validating processes.')
+    parser.add_option('--full', dest='full', action='store_true',
+                      default=False, help='Check unchanged datasets, too.')
 
     def __init__(self, name):
         super(SchemaChecker, self).__init__(name)
@@ -72,21 +122,75 @@ class SchemaChecker(CkanCommand):
         broken_rules = data['broken_rules'][portal][identifier]
 
         data['datasets_per_portal'][portal].add(identifier)
-        errors = Draft3Validator(self.schema).iter_errors(dataset)
+        broken_rules.extend(schema_checker.broken_rules(self.validator,
+                                                        dataset, ' -> '))
 
-        if Draft3Validator(self.schema).is_valid(dataset):
+        if not broken_rules:
             data['valid_datasets'] += 1
         else:
             data['invalid_datasets'] += 1
-            errors = Draft3Validator(self.schema).iter_errors(dataset)
+            for path, message in broken_rules:
+                data['field_paths'][path] += 1
 
-            for error in errors:
-                path = [e for e in error.path if isinstance(e, basestring)]
-                path = str(' -> '.join(map((lambda e: str(e)), path)))
+    def check_serial(self, context, validator):
+        full = self.options.full
 
-                data['field_paths'][path] += 1
-                field_path_message = [path, error.message]
-                broken_rules.append(field_path_message)
+        num_datasets = 0
+        datasets = iterate_local_datasets(context)
+        for chunk in chunks(datasets, self.CHUNK_SIZE):
+            batch = validator.store.batch(validator.chunk_size)
+            if not full:
+                batch.load([dataset['id'] for dataset in chunk])
+
+            for dataset in chunk:
+                print 'Processing dataset %s' % num_datasets
+                normalize_action_dataset(dataset)
+                validator.process_record(dataset, batch, full)
+                num_datasets += 1
+
+            batch.flush()
+
+        return num_datasets
+
+    def check_parallel(self, context, validator):
+        """Validates the datasets in a pool of worker processes, while this
+        process reads the datasets and records the results in dataset
+        order."""
+
+        workers = self.options.workers
+        full = self.options.full
+        pool = Pool(workers, init_worker, (validator.schema,))
+
+        num_datasets = 0
+        try:
+            datasets = iterate_local_datasets(context)
+            for window in chunks(chunks(datasets, self.CHUNK_SIZE),
+                                 workers * 2):
+                batch = validator.store.batch(validator.chunk_size)
+                tasks = []
+                for chunk in window:
+                    known = {}
+                    if not full:
+                        ids = [dataset['id'] for dataset in chunk]
+                        batch.load(ids)
+                        for dataset_id in ids:
+                            known[dataset_id] = validator.known_fingerprint(
+                                dataset_id, batch)
+                    tasks.append((chunk, known))
+
+                for results in pool.map(validate_chunk, tasks):
+                    for dataset_id, portal, fingerprint, rules in results:
+                        print 'Processing dataset %s' % num_datasets
+                        if rules is not None:
+                            validator.record_rules(dataset_id, portal, rules,
+                                                   batch, fingerprint)
+                        num_datasets += 1
+
+                batch.flush()
+        finally:
+            pool.terminate()
+
+        return num_datasets
 
     def create_context(self):
         return {'model':       model,
@@ -113,20 +217,20 @@ class SchemaChecker(CkanCommand):
 
             validator = schema_checker.SchemaChecker()
 
-            num_datasets = 0
-            for i, dataset in enumerate(iterate_local_datasets(context)):
-                print 'Processing dataset %s' % i
-                normalize_action_dataset(dataset)
-                validator.process_record(dataset)
-                num_datasets += 1
+            if self.options.workers > 1:
+                num_datasets = self.check_parallel(context, validator)
+            else:
+                num_datasets = self.check_serial(context, validator)
 
             general = {'num_datasets': num_datasets}
-            validator.redis_client.set('general', general)
+            validator.store.set_general(general)
 
         elif len(self.args) == 2 and self.args[0] == 'remote':
             endpoint = self.args[1]
             ckan = ckanclient.CkanClient(base_location=endpoint)
 
+            self.validator = schema_checker.schema_validator(get_schema())
+
             rows = 1000
             total = self.get_dataset_count(ckan)
             steps = int(ceil(total / float(rows)))
@@ -135,7 +239,7 @@ class SchemaChecker(CkanCommand):
                 if i == steps - 1:
                     rows = total - (i * rows)
 
-                datasets = self.get_datasets(ckan, rows, i)
-                self.validate_datasets(datasets, data)
+                for dataset in self.get_datasets(ckan, rows, i):
+                    self.validate_datasets(dataset, data)
 
             self.write_validation_result(self.render_template(data))
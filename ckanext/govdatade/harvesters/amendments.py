@@ -0,0 +1,191 @@
+#!/bin/env python
+from ckanext.govdatade.harvesters.translator import category_table
+from ckanext.govdatade.registry import get_groups
+
+import uuid
+
+
+def replacer(replacements):
+    """Compiles (old, new) pairs into a function replacing them one after
+    another, in the given order."""
+
+    replacements = tuple(replacements)
+
+    def replace(value):
+        for old, new in replacements:
+            value = value.replace(old, new)
+        return value
+
+    return replace
+
+
+class AmendmentRules(object):
+    """The amendments of the packages of a portal, declared as:
+
+        name_replacements   (old, new) pairs replaced in the name
+        name_suffix         appended to the name
+        name_max_length     the name is truncated to this length
+        id_from_name        derive the id from the name, so that packages
+                            with the same name get the same id
+        fields              package fields which are always set
+        defaults            package fields set if empty, or if their value
+                            is not in allowed
+        allowed             the valid values of package fields
+        extras              extras which are always set
+        extras_defaults     extras set if empty
+        tags                tags added unless present
+        groups              groups added to the remote groups
+        group_replacements  (old, new) pairs replaced in group names
+        group_map           remote group -> groups replacing it, others are
+                            kept
+        group_keep          groups of group_map kept next to their groups
+        group_substrings    substring -> groups added to the remote groups
+                            containing it
+        categories          translate groups with the category mapping of
+                            this source, unmapped groups are dropped
+        known_groups        drop groups which are not GovData groups
+        format_case         'lower' or 'upper'
+        format_replacements (old, new) pairs replaced in resource formats,
+                            after format_case
+
+    The rules are compiled into lookup tables once, and applied in a single
+    pass over the package."""
+
+    def __init__(self, name_replacements=(), name_suffix='',
+                 name_max_length=None, id_from_name=False, fields=None,
+                 defaults=None, allowed=None, extras=None,
+                 extras_defaults=None, tags=(), groups=(),
+                 group_replacements=(), group_map=None, group_keep=(),
+                 group_substrings=None, categories=None, known_groups=False,
+                 format_case='lower', format_replacements=()):
+
+        self.amend_name = bool(name_replacements or name_suffix)
+        self.replace_name = replacer(name_replacements)
+        self.name_suffix = name_suffix
+        self.name_max_length = name_max_length
+        self.id_from_name = id_from_name
+
+        self.fields = dict(fields or {})
+        self.defaults = dict(defaults or {})
+        self.allowed = dict((field, frozenset(values))
+                            for field, values in (allowed or {}).iteritems())
+        self.extras = dict(extras or {})
+        self.extras_defaults = dict(extras_defaults or {})
+        self.tags = tuple(tags)
+
+        self.groups = tuple(groups)
+        self.replace_group = replacer(group_replacements)
+        self.group_map = dict((group, tuple(targets)) for group, targets
+                              in (group_map or {}).iteritems())
+        self.group_keep = frozenset(group_keep)
+        self.group_substrings = tuple(
+            (substring, tuple(targets)) for substring, targets
+            in (group_substrings or {}).iteritems())
+        self.categories = categories
+        self.known_groups = known_groups
+
+        self.format_case = {'lower': unicode.lower,
+                            'upper': unicode.upper}.get(format_case)
+        self.amend_formats = bool(self.format_case or format_replacements)
+        self.replace_format = replacer(format_replacements)
+
+    def apply(self, package):
+        self.apply_many([package])
+
+    def apply_many(self, packages):
+        """Amends the packages in place. The category mapping and the
+        GovData groups are looked up once for all of them."""
+
+        table = None
+        if self.categories:
+            table = category_table(self.categories).groups
+
+        known = None
+        if self.known_groups:
+            known = frozenset(get_groups())
+
+        for package in packages:
+            self.amend(package, table, known)
+
+        return packages
+
+    def amend(self, package, table, known):
+        if self.amend_name:
+            package['name'] = self.replace_name(package['name']) + \
+                self.name_suffix
+        if self.name_max_length:
+            package['name'] = package['name'][:self.name_max_length]
+        if self.id_from_name:
+            package['id'] = str(uuid.uuid5(uuid.NAMESPACE_OID,
+                                           str(package['name'])))
+
+        package.update(self.fields)
+        for field, default in self.defaults.iteritems():
+            value = package.get(field)
+            if not value or (field in self.allowed and
+                             value not in self.allowed[field]):
+                package[field] = default
+
+        extras = package.setdefault('extras', {})
+        extras.update(self.extras)
+        for field, default in self.extras_defaults.iteritems():
+            if not extras.get(field):
+                extras[field] = default
+
+        if self.tags:
+            self.amend_tags(package)
+
+        package['groups'] = self.amend_groups(package.get('groups') or [],
+                                              table, known)
+
+        if self.amend_formats:
+            for resource in package.get('resources') or []:
+                self.amend_format(resource)
+
+    def amend_tags(self, package):
+        tags = package.get('tags')
+        if not tags:
+            tags = []
+        elif isinstance(tags, basestring):
+            tags = [tags]
+
+        for tag in self.tags:
+            if tag not in tags:
+                tags.append(tag)
+        package['tags'] = tags
+
+    def amend_groups(self, groups, table, known):
+        result = []
+        for group in list(groups) + list(self.groups):
+            group = self.replace_group(group)
+
+            if table is not None:
+                targets = table.get(group, ())
+            elif group in self.group_map:
+                targets = self.group_map[group]
+                if group in self.group_keep:
+                    targets = (group,) + targets
+            else:
+                targets = (group,)
+
+            for substring, added in self.group_substrings:
+                if substring in group:
+                    targets = targets + added
+
+            for target in targets:
+                if not target or target in result:
+                    continue
+                if known is not None and target not in known:
+                    continue
+                result.append(target)
+
+        return result
+
+    def amend_format(self, resource):
+        value = resource.get('format')
+        if not value:
+            return
+
+        if self.format_case is not None:
+            value = self.format_case(unicode(value))
+        resource['format'] = self.replace_format(value)
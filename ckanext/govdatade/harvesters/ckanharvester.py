@@ -3,25 +3,51 @@
 
 from ckanext.harvest.harvesters.ckanharvester import CKANHarvester
 from ckanext.harvest.model import HarvestObject
-from ckanext.govdatade.harvesters.translator import translate_groups
-from ckanext.govdatade.util import iterate_local_datasets
+from ckanext.govdatade.harvesters.amendments import AmendmentRules
+from ckanext.govdatade.harvesters.fingerprints import FingerprintStore
+from ckanext.govdatade.harvesters.package_fetcher import PackageFetcher
+from ckanext.govdatade.registry import get_groups
+from ckanext.govdatade.registry import get_schema
+from ckanext.govdatade.util import chunks
+from ckanext.govdatade.util import iterate_json_array
+from ckanext.govdatade.util import spool_url
 from ckanext.govdatade.validators.link_checker import LinkChecker
+from ckanext.govdatade.validators.redis_pool import get_redis_client
+from ckanext.govdatade.validators.schema_checker import dataset_fingerprint
 from ckanext.govdatade import CONFIG
 
 from ckan import model
-from ckan.logic import get_action
 from ckan.logic.schema import default_package_schema
 from ckan.model import Session
 
+from multiprocessing import Pool
+
 import json
 import logging
-import urllib2
 import uuid
+import zipfile
 
 
 log = logging.getLogger(__name__)
 
 
+def decode_zip_members(task):
+    """Decodes the JSON packages of the zip archive members in a worker
+    process. Returns (guid, content, fingerprint) per member."""
+
+    path, names = task
+    archive = zipfile.ZipFile(path)
+    try:
+        packages = []
+        for name in names:
+            package = json.loads(archive.read(name))
+            packages.append((package['name'], json.dumps(package),
+                             dataset_fingerprint(package)))
+        return packages
+    finally:
+        archive.close()
+
+
 def assert_author_fields(package_dict, author_alternative,
                          author_email_alternative):
     """Ensures that the author field is set."""
@@ -49,13 +75,20 @@ class GroupCKANHarvester(CKANHarvester):
     api_version = 1
     """Enforce API version 1 for enabling group import"""
 
+    rules = AmendmentRules(format_case=None)
+    """The declarative amendments of the portal"""
+
     def __init__(self):
-        schema_url = 'https://raw.githubusercontent.com/fraunhoferfokus/ogd-metadata/master/OGPD_JSON_Schema.json' #CONFIG.get('URLs', 'schema')
-        groups_url = 'https://raw.githubusercontent.com/fraunhoferfokus/ogd-metadata/master/kategorien/deutschland.json' #CONFIG.get('URLs', 'groups')
-        self.schema = json.loads(urllib2.urlopen(schema_url).read())
-        self.govdata_groups = json.loads(urllib2.urlopen(groups_url).read())
         self.link_checker = LinkChecker()
 
+    @property
+    def schema(self):
+        return get_schema()
+
+    @property
+    def govdata_groups(self):
+        return get_groups()
+
     def _set_config(self, config_str):
         """Enforce API version 1 for enabling group import"""
         if config_str:
@@ -68,9 +101,121 @@ class GroupCKANHarvester(CKANHarvester):
         self.config['remote_groups'] = 'only_local'
         self.config['user'] = 'harvest'
 
+    def fingerprints(self, source_id):
+        return FingerprintStore(get_redis_client(), source_id)
+
+    def force_import(self):
+        """Unchanged packages are imported anyway if the source config sets
+        force_import, e.g. after the amendments have changed."""
+
+        return self.config.get('force_import', False)
+
+    def package_fetcher(self):
+        headers = {}
+        api_key = self.config.get('api_key', None)
+        if api_key:
+            headers['Authorization'] = api_key
+
+        return PackageFetcher(CONFIG.getint('harvesters', 'fetch_workers'),
+                              CONFIG.getint('harvesters', 'fetch_retries'),
+                              CONFIG.getfloat('harvesters', 'fetch_backoff'),
+                              CONFIG.getfloat('harvesters', 'fetch_timeout'),
+                              headers=headers)
+
+    def package_content(self, content):
+        """Returns the harvest object content for a fetched package body."""
+
+        return content
+
+    def prefetch(self, harvest_objects):
+        """Fetches the packages of the harvest objects concurrently in the
+        gather stage, fetch_window packages at a time, and stores them as
+        content. The fetch stage then only looks the content up. Packages
+        which could not be fetched are fetched again in the fetch stage.
+
+        Only for harvesters fetching every package on its own, which define
+        package_url(harvest_object)."""
+
+        if not CONFIG.getboolean('harvesters', 'prefetch'):
+            return
+
+        window = CONFIG.getint('harvesters', 'fetch_window')
+        fetcher = self.package_fetcher()
+
+        fetched = 0
+        try:
+            for objects in chunks(harvest_objects, window):
+                urls = [self.package_url(obj) for obj in objects]
+                results = fetcher.fetch_many(urls)
+
+                for obj, url, (content, error) in zip(objects, urls, results):
+                    try:
+                        if error is not None:
+                            raise error
+                        obj.content = self.package_content(content)
+                    except Exception, e:
+                        log.warning('Unable to prefetch %s: %r' % (url, e))
+                        continue
+
+                    Session.add(obj)
+                    fetched += 1
+                Session.commit()
+        finally:
+            fetcher.close()
+
+        log.info('Prefetched %s of %s packages'
+                 % (fetched, len(harvest_objects)))
+
+    def fetch_package(self, harvest_object):
+        """Fetch stage of the harvesters fetching every package on its own,
+        see prefetch. Prefetched content is used as it is."""
+
+        if harvest_object.content:
+            return True
+
+        url = self.package_url(harvest_object)
+        fetcher = self.package_fetcher()
+        try:
+            content = fetcher.fetch(url)
+            harvest_object.content = self.package_content(content)
+        except Exception, e:
+            self._save_object_error('Unable to get content for package: '
+                                    '%s: %r' % (url, e), harvest_object)
+            return None
+        finally:
+            fetcher.close()
+
+        harvest_object.save()
+        return True
+
+    def amend_package(self, package):
+        """Fixes the remote package in place. Returns False if the package
+        is not to be imported."""
+
+        self.rules.apply(package)
+
     def import_stage(self, harvest_object):
+        """Parses the remote package once and passes the dict through
+        amend_package and the link checker. It is serialized again only for
+        the CKAN harvester."""
+
+        self._set_config(harvest_object.job.source.config)
         package_dict = json.loads(harvest_object.content)
-        delete = self.link_checker.process_record(package_dict)
+
+        try:
+            valid = self.amend_package(package_dict)
+        except ValueError, e:
+            self._save_object_error(str(e), harvest_object)
+            log.error('%s: %s' % (self.info()['title'], e))
+            return
+
+        if valid is False:
+            return  # drop package
+
+        if CONFIG.get('linkchecker', 'mode') == 'async':
+            delete = self.link_checker.defer_record(package_dict)
+        else:
+            delete = self.link_checker.process_record(package_dict)
         # deactivated until broken links are fixed
         if delete:
             package_dict['state'] = 'deleted'
@@ -78,14 +223,21 @@ class GroupCKANHarvester(CKANHarvester):
             if 'deprecated' not in package_dict['tags']:
                 package_dict['state'] = 'active'
 
-        try:
-            self.amend_package(package_dict)
-        except ValueError, e:
-            self._save_object_error(str(e), harvest_object)
-            log.error('Rostock: ' + str(e))
-            return
+        # Packages are only written if they differ from the last import
+        store = self.fingerprints(harvest_object.job.source.id)
+        fingerprint = dataset_fingerprint(package_dict)
+        if not self.force_import() and \
+           store.unchanged(harvest_object.guid, fingerprint):
+            log.debug('Package %s is unchanged' % harvest_object.guid)
+            store.commit(harvest_object.guid, fingerprint,
+                         package_dict.get('id'))
+            return True
+
         harvest_object.content = json.dumps(package_dict)
-        super(GroupCKANHarvester, self).import_stage(harvest_object)
+        if super(GroupCKANHarvester, self).import_stage(harvest_object):
+            store.commit(harvest_object.guid, fingerprint,
+                         package_dict.get('id'))
+            return True
 
 
 class GovDataHarvester(GroupCKANHarvester):
@@ -99,33 +251,42 @@ class GovDataHarvester(GroupCKANHarvester):
                 'validate':    False,
                 'api_version': 1}
 
-    def portal_relevant(self, portal):
-        def condition_check(dataset):
-            for extra in dataset['extras']:
-                if extra['key'] == 'metadata_original_portal':
-                    value = extra['value']
-                    value = value.lstrip('"').rstrip('"')
-                    return value == portal
+    def local_dataset_names(self, portal):
+        """Returns the names of the active local datasets of the portal.
+        Extra values may be stored JSON encoded, i.e. quoted."""
 
-            return False
+        extra = model.PackageExtra
+        query = Session.query(model.Package.name) \
+            .join(extra, extra.package_id == model.Package.id) \
+            .filter(extra.key == 'metadata_original_portal') \
+            .filter(extra.value.in_([portal, '"%s"' % portal])) \
+            .filter(extra.state == model.State.ACTIVE) \
+            .filter(model.Package.state == model.State.ACTIVE)
 
-        return condition_check
+        return set(name for (name,) in query)
 
     def delete_deprecated_datasets(self, context, remote_dataset_names):
-        package_update = get_action('package_update')
+        local_dataset_names = self.local_dataset_names(self.PORTAL)
 
-        local_datasets = iterate_local_datasets(context)
-        filtered = filter(self.portal_relevant(self.PORTAL), local_datasets)
-        local_dataset_names = map(lambda dataset: dataset['name'], filtered)
-
-        deprecated = set(local_dataset_names) - set(remote_dataset_names)
+        deprecated = local_dataset_names - set(remote_dataset_names)
         log.info('Found %s deprecated datasets.' % len(deprecated))
 
-        for local_dataset in filtered:
-            if local_dataset['name'] in deprecated:
-                local_dataset['state'] = 'deleted'
-                local_dataset['tags'].append({'name': 'deprecated'})
-                package_update(context, local_dataset)
+        if not deprecated:
+            return
+
+        # Delete all of them in a single revision
+        revision = model.repo.new_revision()
+        revision.author = context['user']
+        revision.message = u'Delete datasets removed from %s' % self.PORTAL
+
+        for names in chunks(sorted(deprecated), 500):
+            packages = Session.query(model.Package) \
+                .filter(model.Package.name.in_(names))
+            for package in packages:
+                package.state = model.State.DELETED
+                package.add_tag_by_name(u'deprecated', autoflush=False)
+
+        model.repo.commit()
 
     def gather_stage(self, harvest_job):
         """Retrieve local datasets for synchronization."""
@@ -157,144 +318,94 @@ class RostockCKANHarvester(GovDataHarvester):
 
     PORTAL = 'http://www.opendata-hro.de'
 
+    # packages used to be amended twice, keep the names they were imported with
+    rules = AmendmentRules(name_suffix='-hro-hro',
+                           extras={'metadata_original_portal': PORTAL})
+
     def info(self):
         return {'name':        'rostock',
                 'title':       'Rostock Harvester',
                 'description': 'A CKAN Harvester for Rostock solving data'
                 'compatibility problems.'}
 
-    def amend_package(self, package):
-        portal = 'http://www.opendata-hro.de'
-        package['extras']['metadata_original_portal'] = portal
-        package['name'] = package['name'] + '-hro'
-        for resource in package['resources']:
-                resource['format'] = resource['format'].lower()
-
-    def import_stage(self, harvest_object):
-        package_dict = json.loads(harvest_object.content)
-        try:
-            self.amend_package(package_dict)
-        except ValueError, e:
-            self._save_object_error(str(e), harvest_object)
-            log.error('Rostock: ' + str(e))
-            return
-        harvest_object.content = json.dumps(package_dict)
-        super(RostockCKANHarvester, self).import_stage(harvest_object)
-
 
 class HamburgCKANHarvester(GovDataHarvester):
     """A CKAN Harvester for Hamburg solving data compatibility problems."""
 
+    # fix usage of hyphen, the schema group names use underscores, and add
+    # a tag for better searchability
+    rules = AmendmentRules(group_replacements=[('-', '_')],
+                           tags=[u'Hamburg'])
+
     def info(self):
         return {'name':        'hamburg',
                 'title':       'Hamburg Harvester',
                 'description': 'A CKAN Harvester for Hamburg solving data compatibility problems.'}
 
     def amend_package(self, package):
-
-        # fix usage of hyphen, the schema group names use underscores
-        package['groups'] = [name.replace('-', '_') for name in package['groups']]
-
-        # add tag for better searchability
-        package['tags'].append(u'Hamburg')
-	for resource in package['resources']:
-		resource['format'] = resource['format'].lower()
-
+        self.rules.apply(package)
         assert_author_fields(package, package['maintainer'],
                              package['maintainer_email'])
 
-        for resource in package['resources']:
-                resource['format'] = resource['format'].lower()
-
-    def import_stage(self, harvest_object):
-        package_dict = json.loads(harvest_object.content)
-        try:
-            self.amend_package(package_dict)
-        except ValueError, e:
-            self._save_object_error(str(e), harvest_object)
-            log.error('Hamburg: ' + str(e))
-            return
-        harvest_object.content = json.dumps(package_dict)
-        super(HamburgCKANHarvester, self).import_stage(harvest_object)
-
 
 class BerlinCKANHarvester(GovDataHarvester):
     """A CKAN Harvester for Berlin sovling data compatibility problems."""
 
+    # if sector is not set, set it to 'oeffentlich' (default)
+    rules = AmendmentRules(defaults={'license_id': 'notspecified',
+                                     'type':       'datensatz'},
+                           allowed={'type': ['datensatz', 'dokument', 'app']},
+                           extras_defaults={'sector': 'oeffentlich',
+                                            'metadata_original_portal':
+                                            'http://datenregister.berlin.de'},
+                           categories='berlin')
+
     def info(self):
         return {'name':        'berlin',
                 'title':       'Berlin Harvester',
                 'description': 'A CKAN Harvester for Berlin solving data compatibility problems.'}
 
     def amend_package(self, package):
-
-        extras = package['extras']
-
-        if package['license_id'] == '':
-            package['license_id'] = 'notspecified'
-
-        # if sector is not set, set it to 'oeffentlich' (default)
-        if not extras.get('sector'):
-            extras['sector'] = 'oeffentlich'
-
-        if package['extras']['sector'] != 'oeffentlich':
-            return False
-
-        valid_types = ['datensatz', 'dokument', 'app']
-        if not package.get('type') or package['type'] not in valid_types:
-            package['type'] = 'datensatz'
-
-        package['groups'] = translate_groups(package['groups'], 'berlin')
-        default_portal = 'http://datenregister.berlin.de'
-        if not extras.get('metadata_original_portal'):
-            extras['metadata_original_portal'] = default_portal
-        for resource in package['resources']:
-                resource['format'] = resource['format'].lower()
-        return True
-
-    def import_stage(self, harvest_object):
-        package_dict = json.loads(harvest_object.content)
-        valid = self.amend_package(package_dict)
-
-        if not valid:
-            return  # drop package
-
-        harvest_object.content = json.dumps(package_dict)
-        super(BerlinCKANHarvester, self).import_stage(harvest_object)
+        self.rules.apply(package)
+        return package['extras']['sector'] == 'oeffentlich'
 
 
 class RLPCKANHarvester(GovDataHarvester):
     """A CKAN Harvester for Rhineland-Palatinate sovling data compatibility problems."""
 
+    # map these two group names to schema group names and filter illegal
+    # group names
+    rules = AmendmentRules(extras={'metadata_original_portal':
+                                   'http://daten.rlp.de',
+                                   'sector': 'oeffentlich'},
+                           group_map={'justiz':    ['gesetze_justiz'],
+                                      'transport': ['transport_verkehr']},
+                           known_groups=True)
+
     def info(self):
         return {'name':        'rlp',
                 'title':       'RLP Harvester',
                 'description': 'A CKAN Harvester for Rhineland-Palatinate solving data compatibility problems.'}
 
-    def __init__(self):
-
-        schema_url = 'https://raw.githubusercontent.com/fraunhoferfokus/ogd-metadata/master/OGPD_JSON_Schema.json' #CONFIG.get('URLs', 'schema')
-        groups_url = 'https://raw.githubusercontent.com/fraunhoferfokus/ogd-metadata/master/kategorien/deutschland.json' #CONFIG.get('URLs', 'groups')      
-
-        self.schema = json.loads(urllib2.urlopen(schema_url).read())
-        self.govdata_groups = json.loads(urllib2.urlopen(groups_url).read())
-        self.link_checker = LinkChecker()
-
     def amend_package(self, package_dict):
+        dataset = package_dict['extras']['content_type'].lower() == 'datensatz'
+        if not dataset and not 'gdi-rp' in package_dict['groups']:
+            return False  # skip all non-datasets for the time being
+
         # manually set package type
         if all([resource['format'].lower() == 'pdf' for resource in package_dict['resources']]):
             package_dict['type'] = 'dokument'
         else:
             package_dict['type'] = 'datensatz'
 
-        for resource in package_dict['resources']:
-                resource['format'] = resource['format'].lower()
+        # GDI related patch
+        if 'gdi-rp' in package_dict['groups']:
+            package_dict['type'] = 'datensatz'
 
         assert_author_fields(package_dict, package_dict['point_of_contact'],
                              package_dict['point_of_contact_address']['email'])
 
-        package_dict['extras']['metadata_original_portal'] = 'http://daten.rlp.de'
-        package_dict['extras']['sector'] = 'oeffentlich'
+        self.rules.apply(package_dict)
 
         # the extra fields are present as CKAN core fields in the remote
         # instance: copy all content from these fields into the extras field
@@ -309,39 +420,6 @@ class RLPCKANHarvester(GovDataHarvester):
 
         package_dict['license_id'] = package_dict['extras']['terms_of_use']['license_id']
 
-        # GDI related patch
-        if 'gdi-rp' in package_dict['groups']:
-            package_dict['type'] = 'datensatz'
-
-        # map these two group names to schema group names
-        if 'justiz' in package_dict['groups']:
-            package_dict['groups'].append('gesetze_justiz')
-            package_dict['groups'].remove('justiz')
-
-        if 'transport' in package_dict['groups']:
-            package_dict['groups'].append('transport_verkehr')
-            package_dict['groups'].remove('transport')
-
-        # filter illegal group names
-        package_dict['groups'] = [group for group in package_dict['groups'] if group in self.govdata_groups]
-
-    def import_stage(self, harvest_object):
-        package_dict = json.loads(harvest_object.content)
-
-        dataset = package_dict['extras']['content_type'].lower() == 'datensatz'
-        if not dataset and not 'gdi-rp' in package_dict['groups']:
-            return  # skip all non-datasets for the time being
-
-        try:
-            self.amend_package(package_dict)
-        except ValueError, e:
-            self._save_object_error(str(e), harvest_object)
-            log.error('RLP: ' + str(e))
-            return
-
-        harvest_object.content = json.dumps(package_dict)
-        super(RLPCKANHarvester, self).import_stage(harvest_object)
-
 
 class JSONDumpBaseCKANHarvester(GovDataHarvester):
 
@@ -350,29 +428,59 @@ class JSONDumpBaseCKANHarvester(GovDataHarvester):
                 'title':       'Base Harvester',
                 'description': 'A Base CKAN Harvester for CKANs which return a JSON dump file.'}
 
+    def _spool_content(self, url, named=False):
+        headers = {}
+        api_key = self.config.get('api_key', None)
+        if api_key:
+            headers['Authorization'] = api_key
+        return spool_url(url, headers, named)
+
     def gather_stage(self, harvest_job):
         self._set_config(harvest_job.source.config)
-        # Request all remote packages
+        # Request all remote packages, the dump is spooled to disk
         try:
-            content = self._get_content(harvest_job.source.url)
+            dump = self._spool_content(harvest_job.source.url)
         except Exception, e:
             self._save_gather_error('Unable to get content for URL: %s: %s' % (harvest_job.source.url, str(e)), harvest_job)
             return None
 
+        store = self.fingerprints(harvest_job.source.id)
+        chunk_size = CONFIG.getint('harvesters', 'save_chunk_size')
+
         object_ids = []
+        remote_dataset_names = []
+
+        # Parse one package at a time, so that memory stays bounded. Only
+        # new and changed packages are handed to the import stage.
+        try:
+            for packages in chunks(iterate_json_array(dump), chunk_size):
+                items = [(package['name'], dataset_fingerprint(package))
+                         for package in packages]
+                changed = store.stage(items)
+
+                for package, package_changed in zip(packages, changed):
+                    remote_dataset_names.append(package['name'])
+                    if not package_changed and not self.force_import():
+                        continue
+
+                    obj = HarvestObject(guid=package['name'], job=harvest_job)
+                    obj.content = json.dumps(package)
+                    obj.save()
+                    object_ids.append(obj.id)
+        except ValueError, e:
+            self._save_gather_error('Unable to parse content for URL: %s: %s' % (harvest_job.source.url, str(e)), harvest_job)
+            return None
+        finally:
+            dump.close()
 
-        packages = json.loads(content)
-        for package in packages:
-            obj = HarvestObject(guid=package['name'], job=harvest_job)
-            obj.content = json.dumps(package)
-            obj.save()
-            object_ids.append(obj.id)
+        log.info('%s of %s packages are new or changed'
+                 % (len(object_ids), len(remote_dataset_names)))
+        store.prune(remote_dataset_names)
 
         context = self.build_context()
-        remote_dataset_names = map(lambda d: d['name'], packages)
         self.delete_deprecated_datasets(context, remote_dataset_names)
 
-        if object_ids:
+        if remote_dataset_names:
             return object_ids
         else:
             self._save_gather_error('No packages received for URL: %s' % harvest_job.source.url,
@@ -396,6 +504,12 @@ class BremenCKANHarvester(JSONDumpBaseCKANHarvester):
 
     PORTAL = 'http://daten.bremen.de/sixcms/detail.php?template=export_daten_json_d'
 
+    rules = AmendmentRules(id_from_name=True,
+                           extras={'metadata_original_portal': PORTAL},
+                           extras_defaults={'spatial-text':
+                                            'Bremen 04 0 11 000'},
+                           categories='bremen')
+
     def info(self):
         return {'name':        'bremen',
                 'title':       'Bremen CKAN Harvester',
@@ -411,13 +525,7 @@ class BremenCKANHarvester(JSONDumpBaseCKANHarvester):
         - set spatial text
         '''
 
-        #set metadata original portal
-        package['extras']['metadata_original_portal'] = 'http://daten.bremen.de/sixcms/detail.php?template=export_daten_json_d'
-
-        # set correct groups
-        if not package['groups']:
-            package['groups'] = []
-        package['groups'] = translate_groups(package['groups'], 'bremen')
+        self.rules.apply(package)
 
         #copy veroeffentlichende_stelle to maintainer
         if 'contacts' in package['extras']:
@@ -433,26 +541,6 @@ class BremenCKANHarvester(JSONDumpBaseCKANHarvester):
         else:
             package['license_id'] = u'notspecified'
 
-        if not "spatial-text" in package["extras"]:
-            package["extras"]["spatial-text"] = 'Bremen 04 0 11 000'
-
-        #generate id based on OID namespace and package name, this makes sure,
-        #that packages with the same name get the same id
-        package['id'] = str(uuid.uuid5(uuid.NAMESPACE_OID, str(package['name'])))
-        for resource in package['resources']:
-                resource['format'] = resource['format'].lower()
-
-        for resource in package['resources']:
-                resource['format'] = resource['format'].lower()
-
-    def import_stage(self, harvest_object):
-        package = json.loads(harvest_object.content)
-
-        self.amend_package(package)
-
-        harvest_object.content = json.dumps(package)
-        super(BremenCKANHarvester, self).import_stage(harvest_object)
-
     def fix_terms_of_use(self, terms_of_use):
         terms_of_use['license_id'] = terms_of_use['licence_id']
         del(terms_of_use['licence_id'])
@@ -466,16 +554,16 @@ class BayernCKANHarvester(JSONDumpBaseCKANHarvester):
     which will be loaded to CKAN.
     '''
 
+    rules = AmendmentRules(name_max_length=100, id_from_name=True,
+                           extras_defaults={'spatial-text': 'Bayern 09'})
+
     def info(self):
         return {'name':        'bayern',
                 'title':       'Bavarian CKAN Harvester',
                 'description': 'A CKAN Harvester for Bavaria.'}
 
     def amend_package(self, package):
-        if len(package['name']) > 100:
-            package['name'] = package['name'][:100]
-        if not package['groups']:
-            package['groups'] = []
+        self.rules.apply(package)
 
         #copy autor to author
         quelle = {}
@@ -488,58 +576,49 @@ class BayernCKANHarvester(JSONDumpBaseCKANHarvester):
             if 'email' in quelle:
                 package['author_email'] = quelle['email']
 
-        if not "spatial-text" in package["extras"].keys():
-            package["extras"]["spatial-text"] = 'Bayern 09'
-        for r in package['resources']:
-            r['format'] = r['format'].upper()
-
-        #generate id based on OID namespace and package name, this makes sure,
-        #that packages with the same name get the same id
-        package['id'] = str(uuid.uuid5(uuid.NAMESPACE_OID, str(package['name'])))
-        for resource in package['resources']:
-                resource['format'] = resource['format'].lower()
-
-    def import_stage(self, harvest_object):
-        package = json.loads(harvest_object.content)
-
-        self.amend_package(package)
-
-        harvest_object.content = json.dumps(package)
-        super(BayernCKANHarvester, self).import_stage(harvest_object)
-
 
 class MoersCKANHarvester(JSONDumpBaseCKANHarvester):
     """A CKAN Harvester for Moers solving data compatibility problems."""
 
     PORTAL = 'http://www.offenedaten.moers.de/'
 
+    rules = AmendmentRules(name_replacements=[(u'Ã¤', 'ae'),
+                                              (u'Ã¼', 'ue'),
+                                              (u'Ã¶', 'oe'),
+                                              ('(', ''),
+                                              (')', ''),
+                                              ('.', ''),
+                                              ('/', ''),
+                                              ('http://www.moers.de', '')],
+                           extras={'metadata_original_portal': PORTAL},
+                           extras_defaults={'spatial-text':
+                                            '05 1 70 024 Moers'},
+                           tags=['moers'],
+                           format_replacements=[
+                               ('text/comma-separated-values', 'xls'),
+                               ('application/json', 'json'),
+                               ('application/xml', 'xml')])
+
     def info(self):
         return {'name':        'moers',
                 'title':       'Moers Harvester',
                 'description': 'A CKAN Harvester for Moers solving data compatibility problems.'}
 
-    def amend_dataset_name(self, dataset):
-        dataset['name'] = dataset['name'].replace(u'Ã¤', 'ae')
-        dataset['name'] = dataset['name'].replace(u'Ã¼', 'ue')
-        dataset['name'] = dataset['name'].replace(u'Ã¶', 'oe')
-
-        dataset['name'] = dataset['name'].replace('(', '')
-        dataset['name'] = dataset['name'].replace(')', '')
-        dataset['name'] = dataset['name'].replace('.', '')
-        dataset['name'] = dataset['name'].replace('/', '')
-        dataset['name'] = dataset['name'].replace('http://www.moers.de', '')
-
     def amend_package(self, package):
 
         publishers = filter(lambda x: x['role'] == 'veroeffentlichende_stelle', package['extras']['contacts'])
         maintainers = filter(lambda x: x['role'] == 'ansprechpartner', package['extras']['contacts'])
 
         if not publishers:
-            raise ValueError('There is no author email for package %s' % package_dict['id'])
+            raise ValueError('There is no author email for package %s' % package['name'])
 
-        self.amend_dataset_name(package)
-        package['id'] = str(uuid.uuid5(uuid.NAMESPACE_OID, str(package['name'])))
-        package['name'] = package['name'].lower()
+        self.rules.apply(package)
+
+        # packages used to be amended twice, the second time with the name
+        # lower cased, keep the names and ids they were imported with
+        package['name'] = self.rules.replace_name(package['name'].lower())
+        package['id'] = str(uuid.uuid5(uuid.NAMESPACE_OID,
+                                       str(package['name'])))
 
         if 'moers' not in package['title'].lower():
             package['title'] = package['title'] + ' Moers'
@@ -552,39 +631,6 @@ class MoersCKANHarvester(JSONDumpBaseCKANHarvester):
             package['maintainer_email'] = maintainers[0]['email']
 
         package['license_id'] = package['extras']['terms_of_use']['license_id']
-        package['extras']['metadata_original_portal'] = 'http://www.offenedaten.moers.de/'
-
-        if not "spatial-text" in package["extras"].keys():
-            package["extras"]["spatial-text"] = '05 1 70 024 Moers'
-
-        if isinstance(package['tags'], basestring):
-            if not package['tags']:  # if tags was set to "" or null
-                package['tags'] = []
-            else:
-                package['tags'] = [package['tags']]
-        package['tags'].append('moers')
-
-        for resource in package['resources']:
-            resource['format'] = resource['format'].replace('text/comma-separated-values', 'xls')
-            resource['format'] = resource['format'].replace('application/json', 'json')
-            resource['format'] = resource['format'].replace('application/xml', 'xml')
-
-        for resource in package['resources']:
-                resource['format'] = resource['format'].lower()
-
-        for resource in package['resources']:
-                resource['format'] = resource['format'].lower()
-
-    def import_stage(self, harvest_object):
-        package_dict = json.loads(harvest_object.content)
-        try:
-            self.amend_package(package_dict)
-        except ValueError, e:
-            self._save_object_error(str(e), harvest_object)
-            log.error('Moers: ' + str(e))
-            return
-        harvest_object.content = json.dumps(package_dict)
-        super(MoersCKANHarvester, self).import_stage(harvest_object)
 
 
 class GovAppsHarvester(JSONDumpBaseCKANHarvester):
@@ -593,34 +639,13 @@ class GovAppsHarvester(JSONDumpBaseCKANHarvester):
     which will be loaded to CKAN.
     '''
 
+    rules = AmendmentRules(id_from_name=True, categories='govapps')
+
     def info(self):
         return {'name':        'govapps',
                 'title':       'GovApps Harvester',
                 'description': 'A CKAN Harvester for GovApps.'}
 
-    def amend_package(self, package):
-        if not package['groups']:
-            package['groups'] = []
-        #fix groups
-        if not package['groups']:
-            package['groups'] = []
-        package['groups'] = [x for x in translate_groups(package['groups'], 'govapps') if len(x) > 0]
-
-        #generate id based on OID namespace and package name, this makes sure,
-        #that packages with the same name get the same id
-        package['id'] = str(uuid.uuid5(uuid.NAMESPACE_OID, str(package['name'])))
-
-        for resource in package['resources']:
-                resource['format'] = resource['format'].lower()
-
-    def import_stage(self, harvest_object):
-        package = json.loads(harvest_object.content)
-
-        self.amend_package(package)
-
-        harvest_object.content = json.dumps(package)
-        super(GovAppsHarvester, self).import_stage(harvest_object)
-
 
 class JSONZipBaseHarvester(JSONDumpBaseCKANHarvester):
 
@@ -631,36 +656,57 @@ class JSONZipBaseHarvester(JSONDumpBaseCKANHarvester):
 
     def gather_stage(self, harvest_job):
         self._set_config(harvest_job.source.config)
-        # Request all remote packages
+        # Request all remote packages, the archive is spooled to disk
         try:
-            content = self._get_content(harvest_job.source.url)
+            archive = self._spool_content(harvest_job.source.url, named=True)
         except Exception, e:
             self._save_gather_error('Unable to get content for URL: %s: %s' % (harvest_job.source.url, str(e)), harvest_job)
             return None
 
+        store = self.fingerprints(harvest_job.source.id)
+        workers = CONFIG.getint('harvesters', 'zip_workers')
+        chunk_size = CONFIG.getint('harvesters', 'save_chunk_size')
+
         object_ids = []
-	packages = []
-        import zipfile
-	import StringIO
-	file_content = StringIO.StringIO(content)
-        archive = zipfile.ZipFile(file_content, "r")
-        for name in archive.namelist():
-	    print name
-	    if name.endswith(".json"):
-		package = json.loads(archive.read(name))
-		packages.append(package)
-		obj = HarvestObject(guid=package['name'], job=harvest_job)
-           	obj.content = json.dumps(package)
-            	obj.save()
-            	object_ids.append(obj.id)
-	'''
-        context = self.build_context()
-        remote_dataset_names = map(lambda d: d['name'], packages)
-        self.delete_deprecated_datasets(context, remote_dataset_names)
-        
-	'''
+        guids = []
+        pool = Pool(workers)
+        try:
+            with zipfile.ZipFile(archive) as members:
+                names = [name for name in members.namelist()
+                         if name.endswith('.json')]
+            tasks = [(archive.name, chunk)
+                     for chunk in chunks(names, chunk_size)]
+
+            # Members are decoded by the workers, objects saved per chunk
+            for packages in pool.imap(decode_zip_members, tasks):
+                changed = store.stage([(guid, fingerprint) for
+                                       guid, content, fingerprint in packages])
+
+                for (guid, content, fingerprint), package_changed in \
+                        zip(packages, changed):
+                    guids.append(guid)
+                    if not package_changed and not self.force_import():
+                        continue
+
+                    obj = HarvestObject(id=unicode(uuid.uuid4()), guid=guid,
+                                        job=harvest_job, content=content)
+                    Session.add(obj)
+                    object_ids.append(obj.id)
+                Session.commit()
+        except (zipfile.BadZipfile, ValueError), e:
+            self._save_gather_error('Unable to read archive from URL: %s: %s' % (harvest_job.source.url, str(e)), harvest_job)
+            return None
+        finally:
+            pool.terminate()
+            archive.close()
+
+        log.info('%s of %s packages are new or changed'
+                 % (len(object_ids), len(guids)))
+        store.prune(guids)
 
-	if object_ids:
+        # Deprecated datasets are not deleted for zip archives
+
+        if guids:
             return object_ids
         else:
             self._save_gather_error('No packages received for URL: %s' % harvest_job.source.url,
@@ -671,54 +717,27 @@ class JSONZipBaseHarvester(JSONDumpBaseCKANHarvester):
 class BKGHarvester(JSONZipBaseHarvester):
     PORTAL = 'http://ims.geoportal.de/'
 
+    rules = AmendmentRules(id_from_name=True,
+                           extras={'metadata_original_portal': PORTAL})
+
     def info(self):
         return {'name':        'bkg',
                 'title':       'BKG CKAN Harvester',
                 'description': 'A CKAN Harvester for BKG.'}
 
-    def amend_package(self, package):
-        #generate id based on OID namespace and package name, this makes sure,
-        #that packages with the same name get the same id
-        package['id'] = str(uuid.uuid5(uuid.NAMESPACE_OID, str(package['name'])))
-        package['extras']['metadata_original_portal'] = 'http://ims.geoportal.de/'
-        for resource in package['resources']:
-                resource['format'] = resource['format'].lower()
-
-    def import_stage(self, harvest_object):
-        package = json.loads(harvest_object.content)
-
-        self.amend_package(package)
-
-        harvest_object.content = json.dumps(package)
-        super(JSONZipBaseHarvester, self).import_stage(harvest_object)
-
 
 class DestatisZipHarvester(JSONZipBaseHarvester):
     PORTAL = 'http://destatis.de/'
+
+    # packages used to be amended twice, keep the names they were imported with
+    rules = AmendmentRules(name_suffix='-test-test', id_from_name=True,
+                           extras={'metadata_original_portal': PORTAL})
+
     def info(self):
         return {'name':        'destatis',
                 'title':       'Destatis CKAN Harvester',
                 'description': 'A CKAN Harvester for destatis.'}
 
-    def amend_package(self, package):
-        #generate id based on OID namespace and package name, this makes sure,
-        #that packages with the same name get the same id
-
-	package['name'] = package['name'] + "-test"
-        package['id'] = str(uuid.uuid5(uuid.NAMESPACE_OID, str(package['name'])))
-        package['extras']['metadata_original_portal'] = 'http://destatis.de/'
-
-        for resource in package['resources']:
-                resource['format'] = resource['format'].lower()
-
-    def import_stage(self, harvest_object):
-        package = json.loads(harvest_object.content)
-
-        self.amend_package(package)
-
-        harvest_object.content = json.dumps(package)
-        super(JSONZipBaseHarvester, self).import_stage(harvest_object)
-
 
 class DatahubCKANHarvester(GroupCKANHarvester):
     """A CKAN Harvester for Datahub IO importing a small set of packages."""
@@ -729,12 +748,28 @@ class DatahubCKANHarvester(GroupCKANHarvester):
                       'deutsche-nationalbibliografie-dnb',
                       'dnb-gemeinsame-normdatei']
 
+    rules = AmendmentRules(fields={'type': 'datensatz'},
+                           extras={'metadata_original_portal': portal},
+                           groups=['bildung_wissenschaft'],
+                           known_groups=True)
+
     def info(self):
         return {'name':        'datahub',
                 'title':       'Datahub IO Harvester',
                 'description': 'A CKAN Harvester for Datahub IO importing a '
                                'small set of packages.'}
 
+    def gather_stage(self, harvest_job):
+        object_ids = super(DatahubCKANHarvester, self).gather_stage(harvest_job)
+
+        if object_ids:
+            objects = Session.query(HarvestObject) \
+                .filter(HarvestObject.id.in_(object_ids)).all()
+            self.prefetch([obj for obj in objects
+                           if self.package_valid(obj.guid)])
+
+        return object_ids
+
     def fetch_stage(self, harvest_object):
         log.debug('In CKANHarvester fetch_stage')
         self._set_config(harvest_object.job.source.config)
@@ -742,36 +777,23 @@ class DatahubCKANHarvester(GroupCKANHarvester):
         if harvest_object.guid not in DatahubCKANHarvester.valid_packages:
             return None
 
-        # Get source URL
-        url = harvest_object.source.url.rstrip('/')
-        url = url + self._get_rest_api_offset() + '/package/'
-        url = url + harvest_object.guid
-
-        # Get contents
-        try:
-            content = self._get_content(url)
-        except Exception, e:
-            self._save_object_error('Unable to get content for package:'
-                                    '%s: %r' % (url, e), harvest_object)
-            return None
+        return self.fetch_package(harvest_object)
 
-        # Save the fetched contents in the HarvestObject
-        harvest_object.content = content
-        harvest_object.save()
-        return True
+    def package_url(self, harvest_object):
+        url = harvest_object.job.source.url.rstrip('/')
+        url = url + self._get_rest_api_offset() + '/package/'
+        return url + harvest_object.guid
 
     def package_valid(self, package_name):
         return package_name in DatahubCKANHarvester.valid_packages
 
     def amend_package(self, package_dict):
-        portal = DatahubCKANHarvester.portal
+        self.rules.apply(package_dict)
 
-        package_dict['type'] = 'datensatz'
         # Currently, only the description is displayed. Some datasets only have
         # a descriptive name, but no description. Hence, it is copied if unset.
         for resource in package_dict['resources']:
             description = resource['description'].lower()
-	    resource['format'] = resource['format'].lower()
             name = resource['name']
 
             name_valid = name and not name.isspace()
@@ -781,21 +803,36 @@ class DatahubCKANHarvester(GroupCKANHarvester):
             if description_invalid or (type_only and name_valid):
                 resource['description'] = resource['name']
 
-        for resource in package['resources']:
-                resource['format'] = resource['format'].lower()
-
-        package_dict['extras']['metadata_original_portal'] = portal
-        package_dict['groups'].append('bildung_wissenschaft')
-        package_dict['groups'] = [group for group in package_dict['groups']
-                                  if group in self.govdata_groups]
-
-
 
 class KoelnCKANHarvester(GroupCKANHarvester):
     '''
     A CKAN Harvester for Koeln. The Harvester retrieves a JSON dump,
     which will be loaded to CKAN.
     '''
+
+    # map the category names to schema group names
+    rules = AmendmentRules(group_map={
+        'Geo':                      [u'geo'],
+        'Bildung und Wissenschaft': [u'bildung_wissenschaft'],
+        'Gesetze und Justiz':       [u'gesetze_justiz'],
+        'Gesundheit':               [u'gesundheit'],
+        'Infrastruktur':            [u'infrastruktur_bauen_wohnen'],
+        'Bauen und Wohnen':         [u'infrastruktur_bauen_wohnen'],
+        'Kultur':                   [u'kultur_freizeit_sport_tourismus'],
+        'Freizeit':                 [u'kultur_freizeit_sport_tourismus'],
+        'Sport und Tourismus':      [u'kultur_freizeit_sport_tourismus'],
+        'Politik und Wahlen':       [u'politik_wahlen'],
+        'Soziales':                 [u'soziales'],
+        'Transport und Verkehr':    [u'transport_verkehr'],
+        'Umwelt und Klima':         [u'umwelt_klima'],
+        'Verbraucherschutz':        [u'verbraucher'],
+        'Verwaltung':               [u'verwaltung'],
+        'Haushalt und Steuern':     [u'verwaltung'],
+        'Wirtschaft und Arbeit':    [u'wirtschaft_arbeit']},
+        group_keep=['Politik und Wahlen'],
+        group_substrings={'Bev': [u'bevoelkerung']},
+        format_case=None)
+
     def info(self):
         return {'name':        'koeln',
                 'title':       'Koeln CKAN Harvester',
@@ -820,10 +857,14 @@ class KoelnCKANHarvester(GroupCKANHarvester):
         try:
             object_ids = []
             if len(package_ids):
+                objects = []
                 for package_id in package_ids:                                      
                     obj = HarvestObject(guid = package_id, job = harvest_job)
                     obj.save()
+                    objects.append(obj)
                     object_ids.append(obj.id)
+
+                self.prefetch(objects)
                 return object_ids
 
             else:
@@ -838,107 +879,19 @@ class KoelnCKANHarvester(GroupCKANHarvester):
     def fetch_stage(self,harvest_object):
         log.debug('In KoelnCKANHarvester fetch_stage')
         self._set_config(None)
-       
-        # Get contents
-        package_get_url = ''
-        try:    
-            base_url = harvest_object.source.url.rstrip('/')
-      
-            package_get_url = base_url + '/3/ogdp/action/package_show?id=' + harvest_object.guid
-            content = self._get_content(package_get_url.encode("utf-8"))
-            package = json.loads(content)
-            harvest_object.content = json.dumps(package['result'][0])
-            harvest_object.save()
-
-        except Exception,e:
-            self._save_object_error('Unable to get content for package: %s: %r' % \
-                                        (package_get_url, e),harvest_object)
-            return None
-
-        return True
-
-
-
-
-    def import_stage(self, harvest_object):
-        package_dict = json.loads(harvest_object.content)
-        try:
-            self.amend_package(package_dict)
-        except ValueError, e:
-            self._save_object_error(str(e), harvest_object)
-            log.error('Koeln: ' + str(e))
-            return
-      
-        harvest_object.content = json.dumps(package_dict)
-        super(KoelnCKANHarvester, self).import_stage(harvest_object)
+        return self.fetch_package(harvest_object)
 
+    def package_url(self, harvest_object):
+        base_url = harvest_object.job.source.url.rstrip('/')
+        return base_url + '/3/ogdp/action/package_show?id=' + harvest_object.guid
 
-        
+    def package_content(self, content):
+        package = json.loads(content)
+        return json.dumps(package['result'][0])
 
     def amend_package(self, package):
-        # map these two group names to schema group names
-        out = []
-        if 'Geo' in package['groups']:
-            package['groups'].append('geo')
-            package['groups'].remove('Geo')
-
-        if 'Bildung und Wissenschaft' in package['groups']:
-            package['groups'].append(u'bildung_wissenschaft')
-            package['groups'].remove('Bildung und Wissenschaft')
-
-        if 'Gesetze und Justiz' in package['groups']:
-            package['groups'].append(u'gesetze_justiz')
-            package['groups'].remove('Gesetze und Justiz')
-
-        if 'Gesundheit' in package['groups']:
-            package['groups'].append(u'gesundheit')
-            package['groups'].remove('Gesundheit')
-                  
-        if 'Infrastruktur' in package['groups']:
-            package['groups'].append(u'infrastruktur_bauen_wohnen')
-            package['groups'].remove('Infrastruktur')
-            package['groups'].remove('Bauen und Wohnen')
-            
-        if 'Kultur' in package['groups']:
-            package['groups'].append(u'kultur_freizeit_sport_tourismus')
-            package['groups'].remove('Kultur')
-            package['groups'].remove('Freizeit')
-            package['groups'].remove('Sport und Tourismus')
-            
-        if 'Politik und Wahlen' in package['groups']:
-            package['groups'].append(u'politik_wahlen')
-            package['groups'].append('Politik und Wahlen')
-            
-        if 'Soziales' in package['groups']:
-            package['groups'].append(u'soziales')   
-            package['groups'].remove('Soziales')   
-
-        if 'Transport und Verkehr' in package['groups']:
-            package['groups'].append(u'transport_verkehr')
-            package['groups'].remove('Transport und Verkehr')     
-         
-        if 'Umwelt und Klima' in package['groups']:
-            package['groups'].append(u'umwelt_klima')   
-            package['groups'].remove('Umwelt und Klima')      
-             
-        if 'Verbraucherschutz' in package['groups']:
-            package['groups'].append(u'verbraucher') 
-            package['groups'].remove('Verbraucherschutz')  
-            
-        if 'Verwaltung' in package['groups']:
-            package['groups'].append(u'verwaltung')
-            package['groups'].remove('Verwaltung')   
-            package['groups'].remove('Haushalt und Steuern') 
-                    
-     
-        if 'Wirtschaft und Arbeit' in package['groups']:
-            package['groups'].append(u'wirtschaft_arbeit')
-            package['groups'].remove('Wirtschaft und Arbeit')           
-        
-        for cat in package['groups']:
-            if 'Bev' in cat:
-                package['groups'].append(u'bevoelkerung')   
-        
+        self.rules.apply(package)
+
         from ckan.lib.munge import munge_title_to_name
 
         name = package['name']
@@ -946,11 +899,7 @@ class KoelnCKANHarvester(GroupCKANHarvester):
             name = munge_title_to_name(name).replace('_', '-')
             while '--' in name:
                 name = name.replace('--', '-')
-        except Exception,e:   
+        except Exception,e:
                 log.debug('Encoding Error ' + str(e))
-            
-        package['name'] = name
-  
-        
-     
 
+        package['name'] = name
@@ -0,0 +1,109 @@
+from ckanext.govdatade.validators.record_store import escape_pattern
+from ckanext.govdatade.validators.record_store import scan_keys
+
+import time
+
+
+class FingerprintStore(object):
+    """Remembers what was imported for the packages of a harvest source, in
+    one Redis hash per package guid:
+
+        content  fingerprint of the remote package last imported
+        staged   fingerprint of the remote package gathered for import
+        package  fingerprint of the amended package last imported
+        seen     time the package was last seen on the remote portal
+
+    A staged fingerprint only becomes the content fingerprint once the
+    package has been imported, so that a failed import is retried on the
+    next run. The INDEX hash maps the ids of imported packages to their
+    hashes, so that packages changed outside of the import can be forgotten
+    and are imported again."""
+
+    PREFIX = 'fingerprint:'
+    INDEX = 'fingerprint:ids'
+
+    def __init__(self, redis_client, source_id, scan_count=500):
+        self.redis_client = redis_client
+        self.source_id = source_id
+        self.scan_count = scan_count
+
+    def key(self, guid):
+        return u'%s%s:%s' % (self.PREFIX, self.source_id, guid)
+
+    def get(self, guid):
+        return self.redis_client.hgetall(self.key(guid))
+
+    def stage(self, items):
+        """Takes (guid, fingerprint) pairs of gathered remote packages and
+        returns whether each of them is new or has changed. Changed
+        fingerprints are staged, all packages are marked as seen."""
+
+        pipeline = self.redis_client.pipeline(transaction=False)
+        for guid, fingerprint in items:
+            pipeline.hget(self.key(guid), 'content')
+        current = pipeline.execute()
+
+        now = time.time()
+        changed = []
+        pipeline = self.redis_client.pipeline(transaction=False)
+        for (guid, fingerprint), content in zip(items, current):
+            fields = {'seen': now}
+            if content != fingerprint:
+                fields['staged'] = fingerprint
+            pipeline.hmset(self.key(guid), fields)
+            changed.append(content != fingerprint)
+        pipeline.execute()
+
+        return changed
+
+    def unchanged(self, guid, fingerprint):
+        """Returns whether the amended package was imported as it is."""
+
+        return self.redis_client.hget(self.key(guid), 'package') == fingerprint
+
+    def commit(self, guid, fingerprint, package_id=None):
+        """Records the amended package as imported."""
+
+        key = self.key(guid)
+        staged = self.redis_client.hget(key, 'staged')
+
+        fields = {'package': fingerprint, 'seen': time.time()}
+        if staged is not None:
+            fields['content'] = staged
+
+        pipeline = self.redis_client.pipeline()
+        pipeline.hmset(key, fields)
+        pipeline.hdel(key, 'staged')
+        if package_id is not None:
+            pipeline.hset(self.INDEX, package_id, key)
+        pipeline.execute()
+
+    @classmethod
+    def forget(cls, redis_client, package_id):
+        """Forgets the import of a package, e.g. after it was deleted by the
+        link checker, so that it is imported again on the next run."""
+
+        key = redis_client.hget(cls.INDEX, package_id)
+        if key is not None:
+            pipeline = redis_client.pipeline()
+            pipeline.delete(key)
+            pipeline.hdel(cls.INDEX, package_id)
+            pipeline.execute()
+
+    def prune(self, guids):
+        """Forgets the packages which are no longer on the remote portal, so
+        that they are imported again should they come back. Returns the
+        number of forgotten packages."""
+
+        current = set(self.key(guid) for guid in guids)
+        match = escape_pattern(self.key('')) + '*'
+
+        pruned = 0
+        for keys in scan_keys(self.redis_client, match, self.scan_count):
+            stale = [key for key in keys
+                     if key.decode('utf-8') not in current]
+            if stale:
+                self.redis_client.delete(*stale)
+                pruned += len(stale)
+
+        return pruned
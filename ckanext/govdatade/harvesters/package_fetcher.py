@@ -0,0 +1,73 @@
+from ckanext.govdatade.validators.host_scheduler import HostScheduler
+from ckanext.govdatade.validators.host_scheduler import create_session
+from multiprocessing.pool import ThreadPool
+
+import requests
+import time
+
+
+# Responses worth another attempt
+TRANSIENT_STATUS = frozenset([429, 500, 502, 503, 504])
+
+
+class PackageFetcher(object):
+    """Fetches package bodies over a pooled keep-alive session. The number
+    of requests in flight is limited to workers, and per host by the
+    scheduler. Connection errors, timeouts and transient HTTP errors are
+    retried up to retries times, waiting backoff, 2 * backoff, ... seconds
+    in between."""
+
+    def __init__(self, workers, retries=3, backoff=1.0, timeout=30.0,
+                 host_delay=0.0, headers=None):
+        self.workers = max(1, workers)
+        self.retries = max(0, retries)
+        self.backoff = backoff
+        self.timeout = timeout
+        self.scheduler = HostScheduler(self.workers, host_delay)
+        self.session = create_session(10, self.workers, headers)
+        self.pool = None
+
+    def fetch(self, url):
+        """Returns the body of the URL, or raises the error of the last
+        attempt."""
+
+        for attempt in range(self.retries + 1):
+            try:
+                with self.scheduler.slot(url):
+                    response = self.session.get(url, timeout=self.timeout)
+
+                if response.status_code not in TRANSIENT_STATUS:
+                    response.raise_for_status()
+                    return response.content
+
+                error = requests.HTTPError('%s for %s'
+                                           % (response.status_code, url),
+                                           response=response)
+            except (requests.ConnectionError, requests.Timeout), e:
+                error = e
+
+            if attempt < self.retries:
+                time.sleep(self.backoff * 2 ** attempt)
+
+        raise error
+
+    def try_fetch(self, url):
+        try:
+            return self.fetch(url), None
+        except requests.RequestException, e:
+            return None, e
+
+    def fetch_many(self, urls):
+        """Fetches the URLs concurrently. Returns a (content, error) pair
+        per URL, in the order of the URLs."""
+
+        if self.pool is None:
+            self.pool = ThreadPool(self.workers)
+        return self.pool.map(self.try_fetch, urls)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+        self.session.close()
@@ -1,18 +1,50 @@
 #!/bin/env python
-from ckanext.govdatade import CONFIG
+from ckanext.govdatade.registry import get_category_mapping
 
-import json
-import os
-import urllib2
+import threading
+
+
+_tables = {}
+_lock = threading.Lock()
+
+
+class CategoryTable(object):
+    """Lookup table compiled from a <source>2deutschland.json mapping."""
+
+    def __init__(self, mapping):
+        self.mapping = mapping
+        self.groups = dict((group, tuple(targets))
+                           for group, targets in mapping.iteritems())
+
+    def translate(self, groups):
+        result = []
+        for group in groups:
+            result.extend(self.groups.get(group, ()))
+        return result
+
+
+def category_table(source_name):
+    """Returns the compiled table of the source. The mapping is taken from
+    the registry, which refreshes it after its refresh interval and falls
+    back to the copy on disk. The table is compiled again only when the
+    registry returns a new mapping."""
+
+    mapping = get_category_mapping(source_name)
+
+    with _lock:
+        table = _tables.get(source_name)
+        if table is None or table.mapping is not mapping:
+            table = CategoryTable(mapping)
+            _tables[source_name] = table
+        return table
 
 
 def translate_groups(groups, source_name):
-    url = 'https://raw.github.com/fraunhoferfokus/ogd-metadata/master/kategorien/' + source_name + '2deutschland.json'
-    json_string = urllib2.urlopen(url).read()
-    group_dict = json.loads(json_string)
-
-    result = []
-    for group in groups:
-        if group in group_dict:
-            result = result + group_dict[group]
-    return result
+    return category_table(source_name).translate(groups)
+
+
+def translate_groups_many(group_lists, source_name):
+    """Translates the group lists of many packages with one table lookup."""
+
+    table = category_table(source_name)
+    return [table.translate(groups) for groups in group_lists]
@@ -0,0 +1,187 @@
+from ckanext.govdatade import CONFIG
+
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import urllib2
+
+log = logging.getLogger(__name__)
+
+
+class RegistryError(Exception):
+    pass
+
+
+class Registry(object):
+    """On-disk cache of the metadata documents of the ogd-metadata
+    repository, i.e. the OGPD JSON schema and the category mappings.
+
+    A document is revalidated with its ETag and Last-Modified date at most
+    every refresh_interval seconds. If it cannot be fetched, or in offline
+    mode, the last good copy on disk is served. Parsed documents are also
+    kept in memory, so that reading one is cheap."""
+
+    def __init__(self, cache_dir, refresh_interval, offline=False,
+                 timeout=30):
+        self.cache_dir = cache_dir
+        self.refresh_interval = refresh_interval
+        self.offline = offline
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.documents = {}
+
+    def path(self, name):
+        return os.path.join(self.cache_dir, name)
+
+    def get(self, name, url):
+        """Returns the parsed document stored under name, which is fetched
+        from url."""
+
+        with self.lock:
+            entry = self.documents.get(name)
+            if entry is not None and not self.expired(entry[0]):
+                return entry[1]
+
+            document = self.load(name, url)
+            self.documents[name] = (time.time(), document)
+            return document
+
+    def expired(self, checked):
+        if self.offline:
+            return False
+        return time.time() - checked >= self.refresh_interval
+
+    def load(self, name, url, force=False):
+        meta = self.read_meta(name)
+
+        if not self.offline and \
+           (force or meta is None or self.expired(meta['checked'])):
+            try:
+                return self.fetch(name, url, meta)
+            except (urllib2.URLError, IOError, ValueError) as e:
+                if meta is None:
+                    raise RegistryError('Unable to fetch %s: %s' % (url, e))
+                log.warning('Unable to fetch %s, using the cached copy: %s'
+                            % (url, e))
+
+        if meta is None:
+            raise RegistryError('%s has not been fetched yet' % name)
+
+        return json.load(open(self.path(name)))
+
+    def fetch(self, name, url, meta):
+        request = urllib2.Request(url)
+        if meta is not None and meta['url'] == url:
+            if meta.get('etag'):
+                request.add_header('If-None-Match', meta['etag'])
+            if meta.get('last_modified'):
+                request.add_header('If-Modified-Since', meta['last_modified'])
+
+        try:
+            response = urllib2.urlopen(request, timeout=self.timeout)
+        except urllib2.HTTPError as e:
+            if e.code != 304:
+                raise
+
+            log.debug('%s has not been modified' % url)
+            meta['checked'] = time.time()
+            self.write(name + '.meta', json.dumps(meta))
+            return json.load(open(self.path(name)))
+
+        content = response.read()
+        document = json.loads(content)
+
+        meta = {'url':           url,
+                'etag':          response.info().getheader('ETag'),
+                'last_modified': response.info().getheader('Last-Modified'),
+                'checked':       time.time()}
+
+        self.write(name, content)
+        self.write(name + '.meta', json.dumps(meta))
+        log.info('Fetched %s' % url)
+        return document
+
+    def read_meta(self, name):
+        path = self.path(name + '.meta')
+        if not os.path.exists(path) or not os.path.exists(self.path(name)):
+            return None
+        return json.load(open(path))
+
+    def write(self, name, content):
+        """Replaces the file atomically, so that readers in other processes
+        never see a partial document."""
+
+        path = self.path(name)
+        directory = os.path.dirname(path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        fd, temp_path = tempfile.mkstemp(dir=directory)
+        with os.fdopen(fd, 'w') as temp_file:
+            temp_file.write(content)
+        os.rename(temp_path, path)
+
+    def refresh(self, name, url, force=False):
+        """Revalidates the document now, or once its refresh interval has
+        passed unless force is set."""
+
+        with self.lock:
+            document = self.load(name, url, force)
+            self.documents[name] = (time.time(), document)
+            return document
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    global _registry
+
+    with _registry_lock:
+        if _registry is None:
+            _registry = Registry(CONFIG.get('registry', 'cache_dir'),
+                                 CONFIG.getint('registry', 'refresh_interval'),
+                                 CONFIG.getboolean('registry', 'offline'))
+        return _registry
+
+
+SCHEMA = 'OGPD_JSON_Schema.json'
+GROUPS = 'kategorien/deutschland.json'
+
+# Portals whose groups are translated with a category mapping
+CATEGORY_SOURCES = ['berlin', 'bremen', 'govapps']
+
+
+def category_name(source_name):
+    return 'kategorien/%s2deutschland.json' % source_name
+
+
+def category_url(source_name):
+    return CONFIG.get('URLs', 'categories') + source_name + '2deutschland.json'
+
+
+def documents():
+    """Returns the (name, URL) pairs of all documents in use."""
+
+    result = [(SCHEMA, CONFIG.get('URLs', 'schema')),
+              (GROUPS, CONFIG.get('URLs', 'groups'))]
+    for source_name in CATEGORY_SOURCES:
+        result.append((category_name(source_name), category_url(source_name)))
+    return result
+
+
+def get_schema():
+    return get_registry().get(SCHEMA, CONFIG.get('URLs', 'schema'))
+
+
+def get_groups():
+    return get_registry().get(GROUPS, CONFIG.get('URLs', 'groups'))
+
+
+def get_category_mapping(source_name):
+    return get_registry().get(category_name(source_name),
+                              category_url(source_name))
@@ -0,0 +1,97 @@
+#!/usr/bin/python
+# -*- coding: utf8 -*-
+
+from ckanext.govdatade.harvesters.amendments import AmendmentRules
+from ckanext.govdatade.harvesters.amendments import replacer
+
+import unittest
+
+
+class AmendmentRulesTest(unittest.TestCase):
+
+    def package(self):
+        return {'name':      'Adressen_(2013)',
+                'type':      'garbage',
+                'groups':    ['Geo', 'Bevoelkerung', 'sonstiges'],
+                'tags':      'adressen',
+                'resources': [{'format': 'CSV'},
+                              {'format': 'application/JSON'},
+                              {'format': None}],
+                'extras':    {'sector': ''}}
+
+    def test_replacer(self):
+        replace = replacer([('.', ''), ('http://www.example.com', 'x'),
+                            ('http://wwwexamplecom', 'y')])
+        self.assertEqual(replace('a.b http://www.example.com'), 'ab y')
+        self.assertEqual(replacer([])('a.b'), 'a.b')
+
+    def test_name_and_id(self):
+        rules = AmendmentRules(name_replacements=[('(', ''), (')', '')],
+                               name_suffix='-test', name_max_length=12,
+                               id_from_name=True)
+
+        first, second = self.package(), self.package()
+        rules.apply_many([first, second])
+
+        self.assertEqual(first['name'], 'Adressen_201')
+        self.assertEqual(first['id'], second['id'])
+
+    def test_fields(self):
+        rules = AmendmentRules(fields={'license_id': 'cc-by'},
+                               defaults={'type': 'datensatz'},
+                               allowed={'type': ['datensatz', 'app']},
+                               extras={'metadata_original_portal': 'portal'},
+                               extras_defaults={'sector': 'oeffentlich'},
+                               tags=['moers', 'adressen'])
+
+        package = self.package()
+        rules.apply(package)
+
+        self.assertEqual(package['license_id'], 'cc-by')
+        self.assertEqual(package['type'], 'datensatz')
+        self.assertEqual(package['extras'],
+                         {'metadata_original_portal': 'portal',
+                          'sector':                   'oeffentlich'})
+        self.assertEqual(package['tags'], ['adressen', 'moers'])
+
+        package['type'] = 'app'
+        rules.apply(package)
+        self.assertEqual(package['type'], 'app')
+
+    def test_groups(self):
+        rules = AmendmentRules(groups=['geo'],
+                               group_map={'Geo': ['geo']},
+                               group_substrings={'voelk': ['bevoelkerung']})
+
+        package = self.package()
+        rules.apply(package)
+        self.assertEqual(package['groups'], ['geo', 'Bevoelkerung',
+                                             'bevoelkerung', 'sonstiges'])
+
+        rules = AmendmentRules(group_map={'Geo': ['geo']}, group_keep=['Geo'])
+        package = self.package()
+        rules.apply(package)
+        self.assertEqual(package['groups'], ['Geo', 'geo', 'Bevoelkerung',
+                                             'sonstiges'])
+
+    def test_group_replacements(self):
+        rules = AmendmentRules(group_replacements=[('-', '_')])
+
+        package = {'groups': ['umwelt-klima', 'geo']}
+        rules.apply(package)
+        self.assertEqual(package['groups'], ['umwelt_klima', 'geo'])
+
+    def test_formats(self):
+        rules = AmendmentRules(format_replacements=[('application/json',
+                                                     'json')])
+
+        package = self.package()
+        package['resources'].append({'format': 'application/json; utf-8'})
+        rules.apply(package)
+        formats = [resource['format'] for resource in package['resources']]
+        self.assertEqual(formats, ['csv', 'json', None, 'json; utf-8'])
+
+        rules = AmendmentRules(format_case=None)
+        package = self.package()
+        rules.apply(package)
+        self.assertEqual(package['resources'][0]['format'], 'CSV')
@@ -0,0 +1,63 @@
+from ckanext.govdatade.harvesters.fingerprints import FingerprintStore
+
+import redis
+import unittest
+
+
+class TestFingerprintStore(unittest.TestCase):
+
+    def setUp(self):
+        self.redis_client = redis.StrictRedis(db=1)
+        self.redis_client.flushdb()
+        self.store = FingerprintStore(self.redis_client, 'source')
+
+    def tearDown(self):
+        self.redis_client.flushdb()
+
+    def test_new_packages_changed(self):
+        changed = self.store.stage([('a', '1'), ('b', '2')])
+        self.assertEqual(changed, [True, True])
+
+    def test_imported_packages_unchanged(self):
+        self.store.stage([('a', '1'), ('b', '2')])
+        self.store.commit('a', 'amended-1')
+
+        # b was not imported, so it is gathered again
+        changed = self.store.stage([('a', '1'), ('b', '2')])
+        self.assertEqual(changed, [False, True])
+
+        changed = self.store.stage([('a', '3')])
+        self.assertEqual(changed, [True])
+
+    def test_unchanged(self):
+        self.store.stage([('a', '1')])
+        self.assertFalse(self.store.unchanged('a', 'amended-1'))
+
+        self.store.commit('a', 'amended-1')
+        self.assertTrue(self.store.unchanged('a', 'amended-1'))
+        self.assertFalse(self.store.unchanged('a', 'amended-2'))
+
+    def test_seen(self):
+        self.store.stage([('a', '1')])
+        self.assertTrue(float(self.store.get('a')['seen']) > 0)
+
+    def test_prune(self):
+        self.store.stage([('a', '1'), ('b', '2')])
+        other = FingerprintStore(self.redis_client, 'other')
+        other.stage([('c', '3')])
+
+        self.assertEqual(self.store.prune(['a']), 1)
+        self.assertEqual(self.store.get('b'), {})
+        self.assertNotEqual(self.store.get('a'), {})
+        self.assertNotEqual(other.get('c'), {})
+
+    def test_forget(self):
+        self.store.stage([('a', '1')])
+        self.store.commit('a', 'amended-1', 'package-a')
+
+        # A package deleted by the link checker is gathered and written again
+        FingerprintStore.forget(self.redis_client, 'package-a')
+        self.assertEqual(self.store.stage([('a', '1')]), [True])
+        self.assertFalse(self.store.unchanged('a', 'amended-1'))
+
+        FingerprintStore.forget(self.redis_client, 'unknown')
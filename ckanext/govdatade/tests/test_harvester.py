@@ -4,10 +4,14 @@
 from ckanext.govdatade.harvesters.ckanharvester import BerlinCKANHarvester
 from ckanext.govdatade.harvesters.ckanharvester import MoersCKANHarvester
 from ckanext.govdatade.harvesters.ckanharvester import RLPCKANHarvester
+from ckanext.govdatade.harvesters.ckanharvester import decode_zip_members
 
 import os
 import json
+import tempfile
 import unittest
+import zipfile
+import uuid
 
 
 class BerlinHarvesterTest(unittest.TestCase):
@@ -251,6 +255,21 @@ class MoersHarvesterTest(unittest.TestCase):
 
         self.assertEqual(package['resources'][0]['format'], 'JSON')
 
+    def test_amend_package_id(self):
+        directory = os.path.dirname(os.path.abspath(__file__))
+        moers_file = open(directory + '/moers.json')
+        package = json.loads(moers_file.read())
+        package['name'] = u'Adressen (Stadt).Moers'
+
+        harvester = MoersCKANHarvester()
+        harvester.amend_package(package)
+
+        # the id is derived from the lower cased name
+        self.assertEqual(package['name'], 'adressen stadtmoers')
+        self.assertEqual(package['id'],
+                         str(uuid.uuid5(uuid.NAMESPACE_OID,
+                                        'adressen stadtmoers')))
+
 
 class RLPHarvesterTest(unittest.TestCase):
 
@@ -273,3 +292,25 @@ class RLPHarvesterTest(unittest.TestCase):
         self.assertNotIn('gdi-rp', package['groups'])
         self.assertIn('geo', package['groups'])
         self.assertEqual(package['type'], 'datensatz')
+
+
+class ZipHarvesterTest(unittest.TestCase):
+
+    def test_decode_zip_members(self):
+        packages = [{'name': 'bkg-%s' % i, 'title': 'BKG %s' % i}
+                    for i in range(3)]
+
+        spool = tempfile.NamedTemporaryFile(suffix='.zip')
+        archive = zipfile.ZipFile(spool, 'w')
+        for package in packages:
+            archive.writestr(package['name'] + '.json', json.dumps(package))
+        archive.close()
+        spool.flush()
+
+        names = [package['name'] + '.json' for package in packages]
+        result = decode_zip_members((spool.name, names))
+        spool.close()
+
+        self.assertEqual([guid for guid, content, fingerprint in result],
+                         ['bkg-0', 'bkg-1', 'bkg-2'])
+        self.assertEqual(json.loads(result[1][1]), packages[1])
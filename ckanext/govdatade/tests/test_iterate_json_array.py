@@ -0,0 +1,37 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from ckanext.govdatade.util import iterate_json_array
+from nose.tools import raises
+from StringIO import StringIO
+
+import json
+
+
+def test_packages():
+    packages = [{'name': u'stra\xdfen-%s' % i, 'tags': ['a', 'b'], 'n': i}
+                for i in range(100)]
+    source = json.dumps(packages, ensure_ascii=False).encode('utf-8')
+
+    # Chunks split values and multi-byte characters
+    for chunk_size in [1, 7, 64 * 1024]:
+        result = iterate_json_array(StringIO(source), chunk_size)
+        assert list(result) == packages
+
+
+def test_empty_array():
+    assert list(iterate_json_array(StringIO(' [ ] '), 1)) == []
+
+
+def test_numbers():
+    assert list(iterate_json_array(StringIO('[12, 345]'), 1)) == [12, 345]
+
+
+@raises(ValueError)
+def test_no_array():
+    list(iterate_json_array(StringIO('{"name": "example"}')))
+
+
+@raises(ValueError)
+def test_truncated():
+    list(iterate_json_array(StringIO('[{"name": "example"}, {"na')))
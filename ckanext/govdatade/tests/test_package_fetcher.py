@@ -0,0 +1,50 @@
+from ckanext.govdatade.harvesters.package_fetcher import PackageFetcher
+
+import httpretty
+import requests
+import unittest
+
+
+class TestPackageFetcher(unittest.TestCase):
+
+    URL = 'http://example.com/api/package/%s'
+
+    def setUp(self):
+        self.fetcher = PackageFetcher(4, retries=2, backoff=0.0)
+
+    def tearDown(self):
+        self.fetcher.close()
+
+    @httpretty.activate
+    def test_fetch_many(self):
+        for i in range(5):
+            httpretty.register_uri(httpretty.GET, self.URL % i,
+                                   body='{"name": "%s"}' % i)
+        httpretty.register_uri(httpretty.GET, self.URL % 'missing',
+                               status=404)
+
+        urls = [self.URL % i for i in range(5)] + [self.URL % 'missing']
+        results = self.fetcher.fetch_many(urls)
+
+        self.assertEqual([content for content, error in results[:5]],
+                         ['{"name": "%s"}' % i for i in range(5)])
+        content, error = results[5]
+        self.assertIsNone(content)
+        self.assertIsInstance(error, requests.HTTPError)
+
+    @httpretty.activate
+    def test_retry_transient_errors(self):
+        responses = [httpretty.Response(body='', status=503),
+                     httpretty.Response(body='', status=502),
+                     httpretty.Response(body='{}', status=200)]
+        httpretty.register_uri(httpretty.GET, self.URL % 1,
+                               responses=responses)
+
+        self.assertEqual(self.fetcher.fetch(self.URL % 1), '{}')
+
+    @httpretty.activate
+    def test_give_up(self):
+        httpretty.register_uri(httpretty.GET, self.URL % 1, status=503)
+
+        self.assertRaises(requests.HTTPError, self.fetcher.fetch, self.URL % 1)
+        self.assertEqual(len(httpretty.HTTPretty.latest_requests), 3)
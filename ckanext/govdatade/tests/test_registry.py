@@ -0,0 +1,67 @@
+#!/usr/bin/python
+# -*- coding: utf8 -*-
+
+from ckanext.govdatade.registry import Registry, RegistryError
+from nose.tools import raises
+
+import httpretty
+import shutil
+import tempfile
+
+
+class TestRegistry:
+
+    URL = 'http://www.example.com/deutschland.json'
+
+    def setup(self):
+        self.cache_dir = tempfile.mkdtemp()
+
+    def teardown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def registry(self, refresh_interval=3600, offline=False):
+        return Registry(self.cache_dir, refresh_interval, offline)
+
+    @httpretty.activate
+    def test_cached_on_disk(self):
+        httpretty.register_uri(httpretty.GET, self.URL, body='["bildung"]',
+                               etag='"1"')
+
+        assert self.registry().get('groups', self.URL) == ['bildung']
+        assert self.registry().get('groups', self.URL) == ['bildung']
+        assert len(httpretty.HTTPretty.latest_requests) == 1
+
+    @httpretty.activate
+    def test_revalidated(self):
+        httpretty.register_uri(httpretty.GET, self.URL, body='["bildung"]',
+                               etag='"1"')
+        self.registry(refresh_interval=0).get('groups', self.URL)
+
+        httpretty.register_uri(httpretty.GET, self.URL, status=304)
+        registry = self.registry(refresh_interval=0)
+        assert registry.get('groups', self.URL) == ['bildung']
+
+        request = httpretty.last_request()
+        assert request.headers['If-None-Match'] == '"1"'
+
+    @httpretty.activate
+    def test_offline(self):
+        httpretty.register_uri(httpretty.GET, self.URL, body='["bildung"]')
+        self.registry().get('groups', self.URL)
+
+        registry = self.registry(refresh_interval=0, offline=True)
+        assert registry.get('groups', self.URL) == ['bildung']
+        assert len(httpretty.HTTPretty.latest_requests) == 1
+
+    @httpretty.activate
+    def test_last_good_copy(self):
+        httpretty.register_uri(httpretty.GET, self.URL, body='["bildung"]')
+        self.registry().get('groups', self.URL)
+
+        httpretty.register_uri(httpretty.GET, self.URL, body='["bild')
+        registry = self.registry(refresh_interval=0)
+        assert registry.get('groups', self.URL) == ['bildung']
+
+    @raises(RegistryError)
+    def test_offline_without_copy(self):
+        self.registry(offline=True).get('groups', self.URL)
@@ -0,0 +1,41 @@
+#!/usr/bin/python
+# -*- coding: utf8 -*-
+
+from ckanext.govdatade import registry
+from ckanext.govdatade.harvesters.translator import translate_groups
+from ckanext.govdatade.harvesters.translator import translate_groups_many
+
+import json
+import shutil
+import tempfile
+
+
+class TestTranslator:
+
+    mapping = {'bildung':  ['bildung_wissenschaft'],
+               'umwelt':   ['umwelt_klima', 'geo'],
+               'sonstige': []}
+
+    def setup(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.registry = registry._registry
+
+        registry._registry = registry.Registry(self.cache_dir, 3600,
+                                               offline=True)
+        name = registry.category_name('berlin')
+        registry._registry.write(name, json.dumps(self.mapping))
+        registry._registry.write(name + '.meta', json.dumps({'url': None}))
+
+    def teardown(self):
+        registry._registry = self.registry
+        shutil.rmtree(self.cache_dir)
+
+    def test_translate_groups(self):
+        groups = ['umwelt', 'unbekannt', 'bildung']
+        expectation = ['umwelt_klima', 'geo', 'bildung_wissenschaft']
+        assert translate_groups(groups, 'berlin') == expectation
+
+    def test_translate_groups_many(self):
+        group_lists = [['bildung'], [], ['sonstige', 'umwelt']]
+        expectation = [['bildung_wissenschaft'], [], ['umwelt_klima', 'geo']]
+        assert translate_groups_many(group_lists, 'berlin') == expectation
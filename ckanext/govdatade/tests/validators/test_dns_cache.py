@@ -0,0 +1,59 @@
+from ckanext.govdatade.validators.dns_cache import DNSCache
+from ckanext.govdatade.validators.host_scheduler import create_session
+
+import httpretty
+import socket
+import unittest
+
+
+class TestDNSCache(unittest.TestCase):
+
+    def setUp(self):
+        self.calls = []
+
+    def resolve(self, host, port, *args):
+        self.calls.append(host)
+        if host == 'unknown.example.com':
+            raise socket.gaierror(-2, 'Name or service not known')
+        return [(socket.AF_INET, socket.SOCK_STREAM, 6, '', (host, port))]
+
+    def test_cached(self):
+        cache = DNSCache(60, resolve=self.resolve)
+        first = cache.getaddrinfo('example.com', 80)
+        self.assertEqual(cache.getaddrinfo('example.com', 80), first)
+        self.assertEqual(self.calls, ['example.com'])
+
+    def test_errors_not_cached(self):
+        cache = DNSCache(60, resolve=self.resolve)
+        for i in range(2):
+            self.assertRaises(socket.gaierror, cache.getaddrinfo,
+                              'unknown.example.com', 80)
+        self.assertEqual(self.calls, ['unknown.example.com'] * 2)
+
+    def test_expired(self):
+        cache = DNSCache(0, resolve=self.resolve)
+        cache.getaddrinfo('example.com', 80)
+        cache.getaddrinfo('example.com', 80)
+        self.assertEqual(self.calls, ['example.com'] * 2)
+
+    def test_max_entries(self):
+        cache = DNSCache(60, max_entries=2, resolve=self.resolve)
+        for host in ['a.example.com', 'b.example.com', 'c.example.com']:
+            cache.getaddrinfo(host, 80)
+        self.assertEqual(len(cache.entries), 1)
+
+    @httpretty.activate
+    def test_session(self):
+        httpretty.register_uri(httpretty.GET, 'http://example.com/',
+                               status=200)
+        getaddrinfo = socket.getaddrinfo
+
+        cache = DNSCache(60, resolve=self.resolve)
+        session = create_session(1, 1, dns_cache=cache)
+        response = session.get('http://example.com/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.calls, ['example.com'])
+
+        # Only the session resolves through the cache
+        self.assertIs(socket.getaddrinfo, getaddrinfo)
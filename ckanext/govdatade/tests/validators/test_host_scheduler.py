@@ -0,0 +1,40 @@
+from ckanext.govdatade.validators.host_scheduler import HostScheduler
+from ckanext.govdatade.validators.host_scheduler import host_key
+
+import time
+import unittest
+
+
+class TestHostScheduler(unittest.TestCase):
+
+    def test_host_key(self):
+        self.assertEqual(host_key('http://Example.com/a'), 'example.com')
+        self.assertEqual(host_key('http://example.com:8080/a'),
+                         'example.com:8080')
+
+    def test_host_key_invalid_port(self):
+        self.assertEqual(host_key('http://example.com:80a/a'), 'example.com')
+
+    def test_order_interleaves_hosts(self):
+        urls = ['http://a.de/1', 'http://a.de/2', 'http://a.de/3',
+                'http://b.de/1', 'http://c.de/1', 'http://b.de/2']
+
+        expectation = ['http://a.de/1', 'http://b.de/1', 'http://c.de/1',
+                       'http://a.de/2', 'http://b.de/2', 'http://a.de/3']
+
+        scheduler = HostScheduler(concurrency=1, delay=0)
+        self.assertEqual(scheduler.order(urls), expectation)
+
+    def test_delay_per_host(self):
+        scheduler = HostScheduler(concurrency=1, delay=0.1)
+
+        start = time.time()
+        for i in range(3):
+            with scheduler.slot('http://a.de/%s' % i):
+                pass
+        self.assertGreaterEqual(time.time() - start, 0.2)
+
+        start = time.time()
+        with scheduler.slot('http://b.de/1'):
+            pass
+        self.assertLess(time.time() - start, 0.1)
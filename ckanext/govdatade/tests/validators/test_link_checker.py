@@ -2,6 +2,8 @@ from ckanext.govdatade.validators.link_checker import LinkChecker
 
 import datetime
 import httpretty
+import requests
+import time
 import unittest
 
 
@@ -12,6 +14,7 @@ class TestLinkChecker(unittest.TestCase):
         self.link_checker.redis_client.flushdb()
 
     def tearDown(self):
+        self.link_checker.close()
         self.link_checker.redis_client.flushdb()
 
     def test_is_available_200(self):
@@ -32,6 +35,7 @@ class TestLinkChecker(unittest.TestCase):
     def test_check_url_404(self):
         url = 'http://example.com/dataset/1'
         httpretty.register_uri(httpretty.HEAD, url, status=404)
+        httpretty.register_uri(httpretty.GET, url, status=404)
 
         expectation = 404
         assert self.link_checker.validate(url) == expectation
@@ -54,6 +58,7 @@ class TestLinkChecker(unittest.TestCase):
         httpretty.register_uri(httpretty.HEAD, url1, status=200)
         url2 = 'http://example.com/dataset/2'
         httpretty.register_uri(httpretty.HEAD, url2, status=404)
+        httpretty.register_uri(httpretty.GET, url2, status=404)
         url3 = 'http://example.com/dataset/3'
         httpretty.register_uri(httpretty.HEAD, url3, status=200)
 
@@ -63,6 +68,23 @@ class TestLinkChecker(unittest.TestCase):
 
         assert self.link_checker.check_dataset(dataset) == [200, 404, 200]
 
+    @httpretty.activate
+    def test_check_dataset_hosts(self):
+        url1 = 'http://a.example.com/dataset/1'
+        httpretty.register_uri(httpretty.HEAD, url1, status=200)
+        url2 = 'http://a.example.com/dataset/2'
+        httpretty.register_uri(httpretty.HEAD, url2, status=200)
+        url3 = 'http://b.example.com/dataset/1'
+        httpretty.register_uri(httpretty.HEAD, url3, status=404)
+        httpretty.register_uri(httpretty.GET, url3, status=404)
+
+        # The scheduler interleaves the hosts
+        dataset = {'id': 1,
+                   'name': 'example',
+                   'resources': [{'url': url1}, {'url': url2}, {'url': url3}]}
+
+        assert self.link_checker.check_dataset(dataset) == [200, 200, 404]
+
     def test_redis(self):
         assert self.link_checker.redis_client.ping()
 
@@ -75,7 +97,7 @@ class TestLinkChecker(unittest.TestCase):
 
         date = datetime.datetime(2014, 1, 1)
         self.link_checker.record_failure(dataset, url, status, portal, date)
-        actual_record = eval(self.link_checker.redis_client.get(dataset_id))
+        actual_record = self.link_checker.store.get(dataset_id)
 
         date_string = date.strftime("%Y-%m-%d")
         expected_record = {'id':    dataset_id,
@@ -99,11 +121,11 @@ class TestLinkChecker(unittest.TestCase):
         # Second time to test that the strikes counter has not incremented
         self.link_checker.record_failure(dataset, url, status, None, date)
 
-        actual_record = eval(self.link_checker.redis_client.get(dataset_id))
+        actual_record = self.link_checker.store.get(dataset_id)
 
         date_string = date.strftime("%Y-%m-%d")
         expected_record = {'id':    dataset_id,
-                           'name': 'example.com',
+                           'name': 'example',
                            'urls':  {url: {'status':  404,
                                            'date':    date_string,
                                            'strikes': 1}},
@@ -124,11 +146,11 @@ class TestLinkChecker(unittest.TestCase):
         date = datetime.datetime(2014, 1, 2)
         self.link_checker.record_failure(dataset, url, status, portal, date)
 
-        actual_record = eval(self.link_checker.redis_client.get(dataset_id))
+        actual_record = self.link_checker.store.get(dataset_id)
 
         date_string = date.strftime("%Y-%m-%d")
         expected_record = {'id':    dataset_id,
-                           'name': 'example'
+                           'name': 'example',
                            'urls':  {url: {'status':  404,
                                            'date':    date_string,
                                            'strikes': 2}},
@@ -142,7 +164,7 @@ class TestLinkChecker(unittest.TestCase):
 
         self.link_checker.record_success(dataset_id, url)
 
-        entry = self.link_checker.redis_client.get(dataset_id)
+        entry = self.link_checker.store.get(dataset_id)
         assert entry is None
 
     def test_record_success_after_failure(self):
@@ -153,8 +175,8 @@ class TestLinkChecker(unittest.TestCase):
         dataset = {'id': '1', 'name': 'example'}
 
         date = datetime.datetime(2014, 1, 1)
-        self.link_checker.record_failure(dataset_id, url, status, portal, date)
-        actual_record = eval(self.link_checker.redis_client.get(dataset_id))
+        self.link_checker.record_failure(dataset, url, status, portal, date)
+        actual_record = self.link_checker.store.get(dataset_id)
 
         date_string = date.strftime("%Y-%m-%d")
         expected_record = {'id':    dataset_id,
@@ -167,7 +189,7 @@ class TestLinkChecker(unittest.TestCase):
         self.assertEqual(actual_record, expected_record)
 
         self.link_checker.record_success(dataset_id, url)
-        self.assertIsNone(self.link_checker.redis_client.get(dataset_id))
+        self.assertIsNone(self.link_checker.store.get(dataset_id))
 
     def test_url_success_after_failure(self):
         dataset_id = '1'
@@ -183,10 +205,10 @@ class TestLinkChecker(unittest.TestCase):
         self.link_checker.record_failure(dataset, url1, 404, portal, date)
         self.link_checker.record_failure(dataset, url2, 404, portal, date)
 
-        actual_record = eval(self.link_checker.redis_client.get(dataset_id))
+        actual_record = self.link_checker.store.get(dataset_id)
 
         expected_record = {'id':    dataset_id,
-                           'name': 'example.com'
+                           'name': 'example',
                            'urls':  {url1: {'status':  404,
                                             'date':    date_string,
                                             'strikes': 1},
@@ -198,10 +220,10 @@ class TestLinkChecker(unittest.TestCase):
         self.assertEqual(actual_record, expected_record)
         self.link_checker.record_success(dataset_id, url1)
 
-        actual_record = eval(self.link_checker.redis_client.get(dataset_id))
+        actual_record = self.link_checker.store.get(dataset_id)
 
         expected_record = {'id':    dataset_id,
-                           'name': 'example.com'
+                           'name': 'example',
                            'urls':  {url2: {'status':  404,
                                             'date':    date_string,
                                             'strikes': 1}},
@@ -216,11 +238,164 @@ class TestLinkChecker(unittest.TestCase):
 
         httpretty.register_uri(httpretty.HEAD, url1, status=200)
         httpretty.register_uri(httpretty.HEAD, url2, status=404)
+        httpretty.register_uri(httpretty.GET, url2, status=404)
 
-        dataset = {'id': 1, 'resources': [{'url': url1}, {'url': url2}]}
+        dataset = {'id': 1,
+                   'name': 'example',
+                   'resources': [{'url': url1}, {'url': url2}]}
 
         self.link_checker.process_record(dataset)
-        record = eval(self.link_checker.redis_client.get(1))
+        record = self.link_checker.store.get(1)
+
+        self.assertNotIn(url1, record['urls'])
+        self.assertEqual(record['urls'][url2]['strikes'], 1)
+
+    @httpretty.activate
+    def test_process_records_concurrent(self):
+        url1 = 'http://example.com/dataset/1'
+        url2 = 'http://example.com/dataset/2'
+
+        httpretty.register_uri(httpretty.HEAD, url1, status=200)
+        httpretty.register_uri(httpretty.HEAD, url2, status=404)
+        httpretty.register_uri(httpretty.GET, url2, status=404)
+
+        datasets = [{'id': '1', 'name': 'one', 'resources': [{'url': url1}]},
+                    {'id': '2', 'name': 'two', 'resources': [{'url': url1},
+                                                             {'url': url2}]}]
 
+        link_checker = LinkChecker(workers=4)
+        self.addCleanup(link_checker.close)
+        self.assertEqual(link_checker.process_records(datasets),
+                         [False, False])
+
+        self.assertIsNone(link_checker.store.get('1'))
+        record = link_checker.store.get('2')
         self.assertNotIn(url1, record['urls'])
         self.assertEqual(record['urls'][url2]['strikes'], 1)
+
+    @httpretty.activate
+    def test_check_url_head_not_allowed(self):
+        url = 'http://example.com/dataset/1'
+        httpretty.register_uri(httpretty.HEAD, url, status=405)
+        httpretty.register_uri(httpretty.GET, url, status=200)
+
+        self.assertEqual(self.link_checker.validate(url), 200)
+        self.assertFalse(
+            self.link_checker.capabilities.supports_head('example.com'))
+
+        # The host is known to reject HEAD, thus only GET is sent
+        num_requests = len(httpretty.HTTPretty.latest_requests)
+        self.assertEqual(self.link_checker.validate(url), 200)
+        self.assertEqual(len(httpretty.HTTPretty.latest_requests),
+                         num_requests + 1)
+        self.assertEqual(httpretty.last_request().method, 'GET')
+
+        # The learned table persists in Redis
+        link_checker = LinkChecker()
+        self.assertFalse(link_checker.capabilities.supports_head('example.com'))
+
+        # Until it expires, then the host is probed with HEAD again
+        key = link_checker.capabilities.PREFIX + 'example.com'
+        self.assertGreater(link_checker.redis_client.ttl(key), 0)
+        link_checker.redis_client.delete(key)
+        link_checker = LinkChecker()
+        self.assertTrue(link_checker.capabilities.supports_head('example.com'))
+
+    def test_head_support_expires_in_memory(self):
+        capabilities = self.link_checker.capabilities
+        capabilities.learn('example.com', False)
+        self.assertFalse(capabilities.supports_head('example.com'))
+
+        # A long running checker probes the host again once the entry expired
+        capabilities.hosts['example.com'] = (False, time.time() - 1)
+        self.assertTrue(capabilities.supports_head('example.com'))
+
+        # and learning the same again writes the expired key anew
+        key = capabilities.PREFIX + 'example.com'
+        capabilities.redis_client.delete(key)
+        capabilities.learn('example.com', False)
+        self.assertEqual(capabilities.redis_client.get(key), '0')
+        self.assertFalse(capabilities.supports_head('example.com'))
+
+    @httpretty.activate
+    def test_process_records_schedule(self):
+        url = 'http://example.com/dataset/1'
+        httpretty.register_uri(httpretty.HEAD, url, status=404)
+        httpretty.register_uri(httpretty.GET, url, status=404)
+
+        dataset = {'id': '1', 'name': 'example', 'resources': [{'url': url}]}
+        self.link_checker.url_cache.ttl = 0
+
+        now = time.time()
+        self.link_checker.process_records([dataset], now)
+        num_requests = len(httpretty.HTTPretty.latest_requests)
+
+        # Not due again before the failing interval has passed
+        self.link_checker.process_records([dataset], now + 60)
+        self.assertEqual(len(httpretty.HTTPretty.latest_requests),
+                         num_requests)
+
+        interval = self.link_checker.schedule.failing_interval
+        self.link_checker.process_records([dataset], now + interval)
+        self.assertGreater(len(httpretty.HTTPretty.latest_requests),
+                           num_requests)
+
+        due = self.link_checker.schedule.next_due(now + 2 * interval, 10)
+        self.assertEqual(due, [('1', url)])
+
+    def test_defer_record(self):
+        url = 'http://example.com/dataset/1'
+        dataset = {'id': '1', 'name': 'example', 'resources': [{'url': url}],
+                   'extras': {'metadata_original_portal': None}}
+
+        self.assertFalse(self.link_checker.defer_record(dataset))
+        items = self.link_checker.queue.claim(10)
+        self.assertEqual([item[1] for item in items], [dataset])
+
+        batch = self.link_checker.store.batch(10)
+        batch.set_url('1', url, 404, '2014-01-01', 3)
+        batch.flush()
+        self.assertTrue(self.link_checker.defer_record(dataset))
+
+    def test_check_url_host_unreachable(self):
+        calls = []
+
+        def head(url, **kwargs):
+            calls.append(url)
+            raise requests.exceptions.ConnectionError('Connection refused')
+
+        self.link_checker.session.head = head
+        self.link_checker.breaker.threshold = 2
+
+        urls = ['http://example.com/dataset/%s' % i for i in range(4)]
+        results = [self.link_checker.check_url(url) for url in urls]
+
+        self.assertEqual(results[2:], ['Host Unreachable'] * 2)
+        self.assertEqual(calls, urls[:2])
+
+    def test_check_url_host_recovers(self):
+        def head(url, **kwargs):
+            raise requests.exceptions.ConnectionError('Connection refused')
+
+        self.link_checker.session.head = head
+        self.link_checker.breaker.threshold = 2
+
+        url = 'http://example.com/dataset/1'
+        results = [self.link_checker.check_url(url) for i in range(3)]
+        self.assertEqual(results[2], 'Host Unreachable')
+
+        # After the cooldown one probe is let through, and it fails
+        self.link_checker.breaker.opened['example.com'] -= \
+            self.link_checker.breaker.cooldown
+        self.assertNotEqual(self.link_checker.check_url(url),
+                            'Host Unreachable')
+        self.assertEqual(self.link_checker.check_url(url), 'Host Unreachable')
+
+        # The next probe succeeds and closes the breaker
+        response = requests.Response()
+        response.status_code = 200
+        self.link_checker.session.head = lambda url, **kwargs: response
+        self.link_checker.breaker.opened['example.com'] -= \
+            self.link_checker.breaker.cooldown
+        self.assertEqual(self.link_checker.check_url(url), 200)
+        self.assertEqual(self.link_checker.check_url(url), 200)
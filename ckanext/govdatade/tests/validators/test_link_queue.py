@@ -0,0 +1,54 @@
+from ckanext.govdatade.validators.link_queue import LinkQueue
+
+import redis
+import unittest
+
+
+class TestLinkQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.redis_client = redis.StrictRedis(db=1)
+        self.redis_client.flushdb()
+
+    def tearDown(self):
+        self.redis_client.flushdb()
+
+    def dataset(self, dataset_id):
+        url = 'http://example.com/dataset/%s' % dataset_id
+        return {'id':        dataset_id,
+                'name':      'example-%s' % dataset_id,
+                'extras':    {'metadata_original_portal': None},
+                'resources': [{'url': url}]}
+
+    def test_items_delivered_once(self):
+        first = LinkQueue(self.redis_client, consumer='first')
+        second = LinkQueue(self.redis_client, consumer='second')
+        first.push_many([self.dataset(str(i)) for i in range(5)])
+
+        items = first.claim(3) + second.claim(3)
+        ids = [dataset['id'] for message_id, dataset in items]
+        self.assertEqual(ids, ['0', '1', '2', '3', '4'])
+        self.assertEqual(first.claim(3), [])
+
+    def test_ack_removes_items(self):
+        queue = LinkQueue(self.redis_client, consumer='first')
+        queue.push(self.dataset('1'))
+        self.assertEqual(len(queue), 1)
+
+        queue.ack([message_id for message_id, dataset in queue.claim(10)])
+        self.assertEqual(len(queue), 0)
+
+    def test_stale_items_claimed_again(self):
+        first = LinkQueue(self.redis_client, consumer='first')
+        second = LinkQueue(self.redis_client, consumer='second',
+                           claim_timeout=0, max_deliveries=2)
+        first.push(self.dataset('1'))
+
+        first.claim(10)
+        items = second.claim(10)
+        self.assertEqual([dataset['id'] for message_id, dataset in items],
+                         ['1'])
+
+        # Dropped after max_deliveries
+        self.assertEqual(second.claim(10), [])
+        self.assertEqual(len(second), 0)
@@ -0,0 +1,133 @@
+from ckanext.govdatade.validators.record_store import RecordStore
+from ckanext.govdatade.validators.record_store import decode_record
+from ckanext.govdatade.validators.record_store import encode_record
+from ckanext.govdatade.validators.record_store import migrate_records
+
+import redis
+import unittest
+
+
+class TestRecordStore(unittest.TestCase):
+
+    record = {'id':    '1',
+              'name':  'example',
+              'urls':  {'https://www.example.com': {'status':  404,
+                                                    'date':    '2014-01-01',
+                                                    'strikes': 2}},
+              'schema': [['extras.dates', 'is not of type array']],
+              'metadata_original_portal': 'http://www.example.com'}
+
+    def setUp(self):
+        self.redis_client = redis.StrictRedis(db=1)
+        self.redis_client.flushdb()
+        self.store = RecordStore(self.redis_client)
+
+    def tearDown(self):
+        self.redis_client.flushdb()
+
+    def test_encode_decode(self):
+        fields = encode_record(self.record)
+        fields = dict((key.encode('utf-8'), str(value))
+                      for key, value in fields.iteritems())
+
+        self.assertEqual(decode_record(fields), self.record)
+
+    def test_strikes(self):
+        url = 'https://www.example.com'
+        batch = self.store.batch(10)
+        batch.set_url('1', url, 404, '2014-01-01', 1)
+        batch.flush()
+
+        batch = self.store.batch(10)
+        self.assertEqual(batch.add_strike('1', url, '2014-01-02'), 2)
+        batch.flush()
+
+        record = self.store.get('1')
+        self.assertEqual(record['urls'][url], {'status':  404,
+                                               'date':    '2014-01-02',
+                                               'strikes': 2})
+
+    def test_batch_reads_own_writes(self):
+        url = 'https://www.example.com'
+        batch = self.store.batch(10)
+        batch.load(['1'])
+
+        batch.set_meta('1', id='1', name='example')
+        batch.set_url('1', url, 404, '2014-01-01', 1)
+        self.assertIsNone(self.store.get('1'))
+        self.assertEqual(batch.get_url('1', url)['strikes'], 1)
+
+        batch.flush()
+        self.assertEqual(self.store.get('1'), batch.get('1'))
+
+    def test_batch_chunks(self):
+        batch = self.store.batch(2)
+        for i in range(5):
+            batch.set_meta(str(i), id=str(i))
+
+        self.assertEqual(batch.commands, 1)
+        self.assertIsNone(self.store.get('4'))
+        self.assertEqual(self.store.get('3'), {'id': '3'})
+
+    def test_remove_url_keeps_schema(self):
+        url = 'https://www.example.com'
+        batch = self.store.batch(10)
+        batch.set_meta('1', id='1', schema=[])
+        batch.set_url('1', url, 404, '2014-01-01', 1)
+        batch.flush()
+
+        batch = self.store.batch(10)
+        batch.remove_url('1', url)
+        batch.flush()
+        self.assertEqual(self.store.get('1'), {'id': '1', 'schema': []})
+
+    def test_migrate_records(self):
+        self.redis_client.set('1', self.record)
+        self.redis_client.set('general', {'num_datasets': 1})
+        self.redis_client.set('linkchecker:head_support:example.com', '1')
+        self.redis_client.set('linkchecker:url:http://example.com/', '200')
+
+        migrated, failed = migrate_records(self.redis_client)
+
+        self.assertEqual(migrated, 2)
+        self.assertEqual(failed, [])
+        self.assertEqual(self.store.get('1'), self.record)
+        self.assertEqual(self.store.get_general(), {'num_datasets': 1})
+        self.assertIsNone(self.redis_client.get('1'))
+
+    def test_records(self):
+        batch = self.store.batch(10)
+        for dataset_id in ['a1', 'a2', 'b1', 'a*']:
+            batch.set_meta(dataset_id, id=dataset_id)
+        batch.flush()
+        self.redis_client.set('general', '{}')
+
+        store = RecordStore(self.redis_client, scan_count=1)
+        ids = sorted(record['id'] for record in store.records())
+        self.assertEqual(ids, ['a*', 'a1', 'a2', 'b1'])
+
+        ids = sorted(record['id'] for record in store.records('a'))
+        self.assertEqual(ids, ['a*', 'a1', 'a2'])
+
+        ids = sorted(record['id'] for record in store.records('a*'))
+        self.assertEqual(ids, ['a*'])
+
+    def test_records_rescanned_keys(self):
+        batch = self.store.batch(10)
+        for dataset_id in ['a1', 'a2']:
+            batch.set_meta(dataset_id, id=dataset_id)
+        batch.flush()
+
+        # SCAN returns keys again while the key space is resized
+        keys = [self.store.key('a1'), self.store.key('a2')]
+        replies = [(1, keys[:1]), (2, keys), (0, keys[1:])]
+        execute_command = self.redis_client.execute_command
+
+        def scan(*args):
+            if args[0] == 'SCAN':
+                return replies.pop(0)
+            return execute_command(*args)
+
+        self.redis_client.execute_command = scan
+        ids = [record['id'] for record in self.store.records()]
+        self.assertEqual(ids, ['a1', 'a2'])
@@ -0,0 +1,41 @@
+from ckanext.govdatade.validators.schema_checker import broken_rules
+from ckanext.govdatade.validators.schema_checker import dataset_fingerprint
+from ckanext.govdatade.validators.schema_checker import schema_validator
+
+import unittest
+
+
+class TestSchemaChecker(unittest.TestCase):
+
+    schema = {'type':       'object',
+              'properties': {'name':   {'type': 'string', 'required': True},
+                             'extras': {'type':       'object',
+                                        'properties': {'dates': {
+                                            'type': 'array'}}}}}
+
+    def test_validator_shared(self):
+        validator = schema_validator(self.schema)
+        schema = dict(self.schema)
+        self.assertIs(schema_validator(schema), validator)
+
+        schema['type'] = 'array'
+        self.assertIsNot(schema_validator(schema), validator)
+
+    def test_broken_rules(self):
+        validator = schema_validator(self.schema)
+        self.assertEqual(broken_rules(validator, {'name': 'example'}), [])
+
+        dataset = {'name': 'example', 'extras': {'dates': 'today'}}
+        rules = broken_rules(validator, dataset)
+        self.assertEqual([path for path, message in rules], ['extras.dates'])
+
+    def test_dataset_fingerprint(self):
+        dataset = {'id': '1', 'name': 'example', 'tags': ['a', 'b'],
+                   'tracking_summary': {'total': 1}}
+        fingerprint = dataset_fingerprint(dataset)
+
+        dataset['tracking_summary'] = {'total': 2}
+        self.assertEqual(dataset_fingerprint(dataset), fingerprint)
+
+        dataset['tags'].reverse()
+        self.assertNotEqual(dataset_fingerprint(dataset), fingerprint)
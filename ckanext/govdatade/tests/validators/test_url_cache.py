@@ -0,0 +1,50 @@
+from ckanext.govdatade.validators.url_cache import URLCache
+from ckanext.govdatade.validators.url_cache import canonicalize_url
+
+import redis
+
+
+def test_canonicalize_host():
+    url = 'HTTP://Daten.RLP.de/Dataset/1'
+    assert canonicalize_url(url) == 'http://daten.rlp.de/Dataset/1'
+
+
+def test_canonicalize_default_port():
+    assert canonicalize_url('http://example.com:80/a') == 'http://example.com/a'
+    assert canonicalize_url('https://example.com:443/') == 'https://example.com/'
+    assert canonicalize_url('http://example.com:8080/a') == \
+        'http://example.com:8080/a'
+
+
+def test_canonicalize_fragment():
+    url = 'http://example.com/a?b=c#section'
+    assert canonicalize_url(url) == 'http://example.com/a?b=c'
+
+
+def test_canonicalize_empty_path():
+    assert canonicalize_url('http://example.com') == 'http://example.com/'
+
+
+def test_canonicalize_invalid_port():
+    url = 'http://example.com:port/a'
+    assert canonicalize_url(url) == url
+
+
+def test_cache_failures_briefly():
+    redis_client = redis.StrictRedis(db=1)
+    redis_client.flushdb()
+
+    cache = URLCache(redis_client, 3600, 60)
+    cache.set_many({'http://example.com/a': 404,
+                    'http://example.com/b': 'Timeout'})
+
+    assert cache.get_many(['http://example.com/a', 'http://example.com/b']) \
+        == {'http://example.com/a': 404, 'http://example.com/b': 'Timeout'}
+    assert redis_client.ttl(cache.key('http://example.com/a')) > 60
+    assert redis_client.ttl(cache.key('http://example.com/b')) <= 60
+
+    cache = URLCache(redis_client, 3600)
+    cache.set_many({'http://example.com/c': 'Host Unreachable'})
+    assert cache.get_many(['http://example.com/c']) == {}
+
+    redis_client.flushdb()
@@ -1,15 +1,21 @@
 from ckan.logic import get_action, NotFound
 from ckanext.govdatade import CONFIG
-from ckanext.govdatade.validators import link_checker
-from ckanext.govdatade.validators import schema_checker
+from ckanext.govdatade.validators.redis_pool import get_record_store
 from datetime import datetime
 from collections import defaultdict
 from math import ceil
 
 import ckanclient
+import codecs
 import distutils.dir_util
 import json
 import os
+import re
+import tempfile
+import urllib2
+
+
+WHITESPACE = re.compile(r'\s*', re.UNICODE)
 
 
 def iterate_remote_datasets(endpoint, max_rows=1000):
@@ -47,6 +53,100 @@ def iterate_local_datasets(context, rows=1000):
             pass
 
 
+def chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+
+    if chunk:
+        yield chunk
+
+
+def spool_url(url, headers=None, named=False, chunk_size=64 * 1024):
+    """Downloads the URL into a temporary file, which is returned positioned
+    at its start. The file is anonymous unless named is set, in which case
+    other processes can open it by its name until it is closed."""
+
+    request = urllib2.Request(url)
+    for name, value in (headers or {}).iteritems():
+        request.add_header(name, value)
+
+    response = urllib2.urlopen(request)
+    if named:
+        spool = tempfile.NamedTemporaryFile()
+    else:
+        spool = tempfile.TemporaryFile()
+    try:
+        for chunk in iter(lambda: response.read(chunk_size), ''):
+            spool.write(chunk)
+    except:
+        spool.close()
+        raise
+    finally:
+        response.close()
+
+    spool.seek(0)
+    return spool
+
+
+def iterate_json_array(source, chunk_size=64 * 1024):
+    """Parses the top-level JSON array of the UTF-8 encoded file object
+    incrementally and yields one element at a time, so that only the
+    element being parsed is held in memory. Raises ValueError if the
+    content is not a JSON array."""
+
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder('utf-8')()
+
+    def read(buf, pos):
+        chunk = source.read(chunk_size)
+        return buf[pos:] + utf8.decode(chunk, not chunk), 0, not chunk
+
+    buf, pos, eof = u'', 0, False
+    state = '['
+
+    while True:
+        pos = WHITESPACE.match(buf, pos).end()
+        if pos == len(buf):
+            if eof:
+                raise ValueError('Unexpected end of JSON array')
+            buf, pos, eof = read(buf, pos)
+            continue
+
+        char = buf[pos]
+        if state == '[':
+            if char != '[':
+                raise ValueError('Expected a JSON array')
+            pos += 1
+            state = 'first'
+        elif state != 'value' and char == ']':
+            return
+        elif state == 'separator':
+            if char != ',':
+                raise ValueError('Expected , or ] at position %s' % pos)
+            pos += 1
+            state = 'value'
+        else:
+            try:
+                value, end = decoder.raw_decode(buf, pos)
+            except ValueError:
+                if eof:
+                    raise
+                end = None
+
+            # The value may continue beyond the buffer, read on
+            if end is None or (end == len(buf) and not eof):
+                buf, pos, eof = read(buf, pos)
+                continue
+
+            yield value
+            pos = end
+            state = 'separator'
+
+
 def normalize_action_dataset(dataset):
     dataset['groups'] = [group['name'] for group in dataset['groups']]
     dataset['tags'] = [group['name'] for group in dataset['tags']]
@@ -106,15 +206,14 @@ def is_valid(source):
 
 
 def generate_link_checker_data(data):
-    checker = link_checker.LinkChecker()
-    redis = checker.redis_client
-    num_metadata = eval(redis.get('general'))['num_datasets']
+    store = get_record_store()
+    num_metadata = store.get_general()['num_datasets']
 
     data['linkchecker'] = {}
     data['portals'] = defaultdict(int)
     data['entries'] = defaultdict(list)
 
-    for record in checker.get_records():
+    for record in store.records():
         if 'urls' not in record:
             continue
 
@@ -133,9 +232,8 @@ def generate_link_checker_data(data):
 
 
 def generate_schema_checker_data(data):
-    validator = schema_checker.SchemaChecker()
-    redis = validator.redis_client
-    num_metadata = eval(redis.get('general'))['num_datasets']
+    store = get_record_store()
+    num_metadata = store.get_general()['num_datasets']
 
     data['schema']['portal_statistic'] = defaultdict(int)
     data['schema']['rule_statistic'] = defaultdict(int)
@@ -147,7 +245,7 @@ def generate_schema_checker_data(data):
 
     broken = 0
 
-    for record in validator.get_records():
+    for record in store.records():
         dataset_id = record['id']
         portal = record['metadata_original_portal']
 
@@ -170,10 +268,9 @@ def generate_schema_checker_data(data):
 
 
 def generate_general_data(data):
-    validator = schema_checker.SchemaChecker()
-    redis = validator.redis_client
+    store = get_record_store()
 
-    data['num_datasets'] = eval(redis.get('general'))['num_datasets']
+    data['num_datasets'] = store.get_general()['num_datasets']
     data['timestamp'] = datetime.today().strftime("%Y-%m-%d %H:%M")
 
 
@@ -0,0 +1,171 @@
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.connection import HTTPConnection
+from requests.packages.urllib3.connection import VerifiedHTTPSConnection
+from requests.packages.urllib3.exceptions import ConnectTimeoutError
+from requests.packages.urllib3.packages.ssl_match_hostname import \
+    match_hostname
+from requests.packages.urllib3.poolmanager import PoolManager
+from requests.packages.urllib3.util import assert_fingerprint
+from requests.packages.urllib3.util import resolve_cert_reqs
+from requests.packages.urllib3.util import resolve_ssl_version
+from requests.packages.urllib3.util import ssl_wrap_socket
+
+import socket
+import ssl
+import threading
+import time
+
+
+class DNSCache(object):
+    """Caches the results of socket.getaddrinfo for ttl seconds. Resolution
+    errors are not cached, as they are often temporary. Once the cache holds
+    max_entries, expired entries are dropped, or all if none expired."""
+
+    def __init__(self, ttl, max_entries=10000, resolve=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.resolve = resolve
+        self.lock = threading.Lock()
+        self.entries = {}
+
+    def getaddrinfo(self, *args):
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(args)
+
+        if entry is not None and entry[0] > now:
+            return entry[1]
+
+        resolve = self.resolve or socket.getaddrinfo
+        result = resolve(*args)
+
+        with self.lock:
+            if len(self.entries) >= self.max_entries:
+                self.prune(now)
+            self.entries[args] = (now + self.ttl, result)
+
+        return result
+
+    def prune(self, now):
+        expired = [args for args, (expires, result)
+                   in self.entries.iteritems() if expires <= now]
+        if not expired:
+            self.entries.clear()
+
+        for args in expired:
+            del self.entries[args]
+
+    def create_connection(self, address,
+                          timeout=socket._GLOBAL_DEFAULT_TIMEOUT,
+                          source_address=None):
+        """socket.create_connection, resolving the host through the cache."""
+
+        host, port = address
+        error = None
+        for family, socktype, proto, canonname, sockaddr in \
+                self.getaddrinfo(host, port, 0, socket.SOCK_STREAM):
+            sock = None
+            try:
+                sock = socket.socket(family, socktype, proto)
+                if timeout is not socket._GLOBAL_DEFAULT_TIMEOUT:
+                    sock.settimeout(timeout)
+                if source_address:
+                    sock.bind(source_address)
+                sock.connect(sockaddr)
+                return sock
+            except socket.error as e:
+                error = e
+                if sock is not None:
+                    sock.close()
+
+        if error is not None:
+            raise error
+        raise socket.error('getaddrinfo returns an empty list')
+
+
+class CachedConnection(object):
+    """Opens the sockets of an urllib3 connection through dns_cache."""
+
+    dns_cache = None
+
+    def _new_conn(self):
+        conn = self.dns_cache.create_connection(
+            (self.host, self.port), self.timeout,
+            getattr(self, 'source_address', None))
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY,
+                        self.tcp_nodelay)
+        return conn
+
+
+class CachedHTTPConnection(CachedConnection, HTTPConnection):
+    pass
+
+
+class CachedHTTPSConnection(CachedConnection, VerifiedHTTPSConnection):
+
+    def connect(self):
+        # VerifiedHTTPSConnection.connect, but opening the socket through
+        # _new_conn
+        try:
+            sock = self._new_conn()
+        except socket.timeout:
+            raise ConnectTimeoutError(
+                self, 'Connection to %s timed out. (connect timeout=%s)' %
+                (self.host, self.timeout))
+
+        if getattr(self, '_tunnel_host', None):
+            self.sock = sock
+            self._tunnel()
+
+        cert_reqs = resolve_cert_reqs(self.cert_reqs)
+        self.sock = ssl_wrap_socket(sock, self.key_file, self.cert_file,
+                                    cert_reqs=cert_reqs,
+                                    ca_certs=self.ca_certs,
+                                    server_hostname=self.host,
+                                    ssl_version=resolve_ssl_version(
+                                        self.ssl_version))
+
+        if cert_reqs != ssl.CERT_NONE:
+            if self.assert_fingerprint:
+                assert_fingerprint(self.sock.getpeercert(binary_form=True),
+                                   self.assert_fingerprint)
+            elif self.assert_hostname is not False:
+                match_hostname(self.sock.getpeercert(),
+                               self.assert_hostname or self.host)
+
+
+class CachedPoolManager(PoolManager):
+
+    def __init__(self, dns_cache, **kwargs):
+        PoolManager.__init__(self, **kwargs)
+        attributes = {'dns_cache': dns_cache}
+        self.connection_classes = {
+            'http': type('HTTPConnection', (CachedHTTPConnection,),
+                         attributes),
+            'https': type('HTTPSConnection', (CachedHTTPSConnection,),
+                          attributes)}
+
+    def _new_pool(self, scheme, host, port):
+        pool = PoolManager._new_pool(self, scheme, host, port)
+        pool.ConnectionCls = self.connection_classes[scheme]
+        return pool
+
+
+class CachedDNSAdapter(HTTPAdapter):
+    """An HTTPAdapter resolving host names through a DNSCache. Only the
+    connections of this adapter use the cache, name resolution of the rest
+    of the process is left alone. Connections through a proxy do not use
+    the cache."""
+
+    def __init__(self, dns_cache, **kwargs):
+        self.dns_cache = dns_cache
+        super(CachedDNSAdapter, self).__init__(**kwargs)
+
+    def init_poolmanager(self, connections, maxsize, block=False):
+        self._pool_connections = connections
+        self._pool_maxsize = maxsize
+        self._pool_block = block
+
+        self.poolmanager = CachedPoolManager(self.dns_cache,
+                                             num_pools=connections,
+                                             maxsize=maxsize, block=block)
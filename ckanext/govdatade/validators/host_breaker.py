@@ -0,0 +1,50 @@
+import threading
+import time
+
+
+class HostUnreachable(Exception):
+    pass
+
+
+class HostBreaker(object):
+    """Circuit breaker per host. After threshold consecutive connection
+    failures or timeouts the breaker of a host opens, so that the remaining
+    URLs of a dead host are not requested at all. After cooldown seconds a
+    single request is let through as a probe: any HTTP response closes the
+    breaker again, a failure keeps it open for another cooldown. Any HTTP
+    response resets the count. A threshold of 0 disables the breaker."""
+
+    def __init__(self, threshold, cooldown):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.lock = threading.Lock()
+        self.failures = {}
+        self.opened = {}
+
+    def is_open(self, host):
+        if self.threshold <= 0:
+            return False
+
+        with self.lock:
+            if self.failures.get(host, 0) < self.threshold:
+                return False
+
+            now = time.time()
+            if now < self.opened[host] + self.cooldown:
+                return True
+
+            # Half open, the next requests wait for this probe
+            self.opened[host] = now
+            return False
+
+    def success(self, host):
+        with self.lock:
+            self.failures.pop(host, None)
+            self.opened.pop(host, None)
+
+    def failure(self, host):
+        with self.lock:
+            self.failures[host] = self.failures.get(host, 0) + 1
+            if host not in self.opened and \
+               self.failures[host] >= self.threshold:
+                self.opened[host] = time.time()
@@ -0,0 +1,65 @@
+from ckanext.govdatade.validators.record_store import escape_pattern
+from ckanext.govdatade.validators.record_store import scan_keys
+
+import threading
+import time
+
+
+class HostCapabilities(object):
+    """Remembers per host whether HEAD requests are answered properly. The
+    table is loaded from and written through to one Redis key per host, so
+    that it persists between runs. The entries expire after ttl seconds, in
+    Redis and in memory, so that a host is probed again once it may have
+    changed its server."""
+
+    PREFIX = 'linkchecker:head_support:'
+
+    def __init__(self, redis_client, ttl, scan_count=500):
+        self.redis_client = redis_client
+        self.ttl = ttl
+        self.scan_count = scan_count
+        self.lock = threading.Lock()
+        self.hosts = None
+
+    def load(self):
+        with self.lock:
+            if self.hosts is not None:
+                return
+
+            self.hosts = {}
+            now = time.time()
+            match = escape_pattern(self.PREFIX) + '*'
+            for keys in scan_keys(self.redis_client, match, self.scan_count):
+                pipeline = self.redis_client.pipeline(transaction=False)
+                for key in keys:
+                    pipeline.get(key)
+                    pipeline.ttl(key)
+                replies = pipeline.execute()
+
+                for key, value, ttl in zip(keys, replies[::2], replies[1::2]):
+                    if value is not None and ttl > 0:
+                        host = key[len(self.PREFIX):]
+                        self.hosts[host] = (value == '1', now + ttl)
+
+    def lookup(self, host):
+        """Returns whether the host supports HEAD, or None if unknown."""
+
+        entry = self.hosts.get(host)
+        if entry is None or entry[1] <= time.time():
+            return None
+        return entry[0]
+
+    def supports_head(self, host):
+        self.load()
+        with self.lock:
+            return self.lookup(host) is not False
+
+    def learn(self, host, supports_head):
+        self.load()
+        with self.lock:
+            if self.lookup(host) == supports_head:
+                return
+            self.hosts[host] = (supports_head, time.time() + self.ttl)
+
+        self.redis_client.setex(self.PREFIX + host, self.ttl,
+                                int(supports_head))
@@ -0,0 +1,106 @@
+from ckanext.govdatade.validators.dns_cache import CachedDNSAdapter
+from collections import OrderedDict
+from contextlib import contextmanager
+from requests.adapters import HTTPAdapter
+
+import requests
+import threading
+import time
+import urlparse
+
+
+def host_key(url):
+    parts = urlparse.urlsplit(url)
+    host = (parts.hostname or '').lower()
+    try:
+        port = parts.port
+    except ValueError:  # invalid port, the request fails on its own
+        return host
+    if port:
+        host = '%s:%s' % (host, port)
+    return host
+
+
+def create_session(pool_connections, pool_maxsize, headers=None,
+                   dns_cache=None):
+    """Creates a session keeping up to pool_maxsize connections alive for
+    each of the pool_connections most recently used hosts. With a DNSCache,
+    the session resolves host names through it."""
+
+    if dns_cache is None:
+        adapter = HTTPAdapter(pool_connections=pool_connections,
+                              pool_maxsize=pool_maxsize)
+    else:
+        adapter = CachedDNSAdapter(dns_cache,
+                                   pool_connections=pool_connections,
+                                   pool_maxsize=pool_maxsize)
+
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
+    if headers:
+        session.headers.update(headers)
+
+    return session
+
+
+class HostScheduler(object):
+    """Limits the number of concurrent requests per host and enforces a
+    minimum delay between the start of two requests to the same host."""
+
+    def __init__(self, concurrency, delay):
+        self.concurrency = max(1, concurrency)
+        self.delay = max(0.0, delay)
+        self.lock = threading.Lock()
+        self.semaphores = {}
+        self.next_start = {}
+
+    @contextmanager
+    def slot(self, url):
+        host = host_key(url)
+        semaphore = self.semaphore(host)
+
+        semaphore.acquire()
+        try:
+            self.wait(host)
+            yield
+        finally:
+            semaphore.release()
+
+    def semaphore(self, host):
+        with self.lock:
+            if host not in self.semaphores:
+                semaphore = threading.BoundedSemaphore(self.concurrency)
+                self.semaphores[host] = semaphore
+            return self.semaphores[host]
+
+    def wait(self, host):
+        with self.lock:
+            now = time.time()
+            start = max(now, self.next_start.get(host, now))
+            self.next_start[host] = start + self.delay
+
+        if start > now:
+            time.sleep(start - now)
+
+    def order(self, urls):
+        """Interleaves the URLs round-robin by host, so that a pool of
+        workers spreads over all hosts instead of queueing on a hot one."""
+
+        queues = OrderedDict()
+        for url in urls:
+            queues.setdefault(host_key(url), []).append(url)
+
+        result = []
+        queues = [iter(queue) for queue in queues.values()]
+        while queues:
+            remaining = []
+            for queue in queues:
+                url = next(queue, None)
+                if url is not None:
+                    result.append(url)
+                    remaining.append(queue)
+            queues = remaining
+
+        return result
@@ -1,9 +1,25 @@
+from ckanext.govdatade import CONFIG
+from ckanext.govdatade.validators.dns_cache import DNSCache
+from ckanext.govdatade.validators.host_breaker import HostBreaker
+from ckanext.govdatade.validators.host_breaker import HostUnreachable
+from ckanext.govdatade.validators.host_capabilities import HostCapabilities
+from ckanext.govdatade.validators.host_scheduler import HostScheduler
+from ckanext.govdatade.validators.host_scheduler import create_session
+from ckanext.govdatade.validators.host_scheduler import host_key
+from ckanext.govdatade.validators.link_queue import LinkQueue
+from ckanext.govdatade.validators.link_schedule import LinkSchedule
+from ckanext.govdatade.validators.redis_pool import get_record_store
+from ckanext.govdatade.validators.redis_pool import get_redis_client
+from ckanext.govdatade.validators.url_cache import URLCache
+from ckanext.govdatade.validators.url_cache import canonicalize_url
+from collections import OrderedDict
 from datetime import datetime
+from multiprocessing.pool import ThreadPool
 
-import redis
 import requests
 import socket
 import logging
+import time
 
 log = logging.getLogger(__name__)
 
@@ -12,134 +28,274 @@ class LinkChecker:
     HEADERS = {'User-Agent': 'curl/7.29.0'}
     TIMEOUT = 30.0
 
-    def __init__(self, db='production'):
-        redis_db_dict = {'production': 0, 'test': 1}
-        database = redis_db_dict[db]
-        self.redis_client = redis.StrictRedis(host='localhost',
-                                              port=6379,
-                                              db=database)
+    def __init__(self, db='production', workers=None):
+        self.redis_client = get_redis_client(db)
+        self.store = get_record_store(db)
+        self.chunk_size = CONFIG.getint('validators', 'write_chunk_size')
+
+        if workers is None:
+            workers = CONFIG.getint('linkchecker', 'workers')
+        self.workers = max(1, workers)
+        self.pool = None
+
+        host_concurrency = CONFIG.getint('linkchecker', 'host_concurrency')
+        host_delay = CONFIG.getfloat('linkchecker', 'host_delay')
+        pool_connections = CONFIG.getint('linkchecker', 'pool_connections')
+
+        dns_cache = None
+        dns_ttl = CONFIG.getint('linkchecker', 'dns_ttl')
+        if dns_ttl > 0:
+            dns_cache = DNSCache(dns_ttl)
+
+        self.scheduler = HostScheduler(host_concurrency, host_delay)
+        self.session = create_session(pool_connections, host_concurrency,
+                                      self.HEADERS, dns_cache)
+        head_support_ttl = CONFIG.getint('linkchecker', 'head_support_ttl')
+        self.capabilities = HostCapabilities(self.redis_client,
+                                             head_support_ttl)
+
+        breaker_threshold = CONFIG.getint('linkchecker', 'breaker_threshold')
+        breaker_cooldown = CONFIG.getint('linkchecker', 'breaker_cooldown')
+        self.breaker = HostBreaker(breaker_threshold, breaker_cooldown)
+
+        cache_ttl = CONFIG.getint('linkchecker', 'cache_ttl')
+        failure_cache_ttl = CONFIG.getint('linkchecker', 'failure_cache_ttl')
+        self.url_cache = URLCache(self.redis_client, cache_ttl,
+                                  failure_cache_ttl)
+
+        healthy_interval = CONFIG.getint('linkchecker', 'healthy_interval')
+        failing_interval = CONFIG.getint('linkchecker', 'failing_interval')
+        self.schedule = LinkSchedule(self.redis_client, healthy_interval,
+                                     failing_interval)
+
+        claim_timeout = CONFIG.getint('linkchecker', 'claim_timeout')
+        max_deliveries = CONFIG.getint('linkchecker', 'max_deliveries')
+        self.queue = LinkQueue(self.redis_client,
+                               claim_timeout=claim_timeout,
+                               max_deliveries=max_deliveries)
 
     def process_record(self, dataset):
+        return self.process_records([dataset])[0]
+
+    def defer_record(self, dataset):
+        """Queues the dataset for a link checker worker. Returns whether one
+        of its URLs has already reached 3 strikes."""
+
+        self.queue.push(dataset)
+        return self.struck_out(dataset)
+
+    def struck_out(self, dataset):
+        record = self.store.get(dataset['id'])
+        if record is None:
+            return False
+
+        urls = record.get('urls', {})
+        return any(urls[resource['url']]['strikes'] >= 3
+                   for resource in dataset['resources']
+                   if resource['url'] in urls)
+
+    def process_records(self, datasets, now=None):
+        """Checks the URLs of all datasets concurrently, but records the
+        results sequentially in dataset and resource order. Only URLs which
+        are due according to the schedule are checked. Returns a list of
+        delete flags, one per dataset."""
+
+        if now is None:
+            now = time.time()
+
+        entries = [(dataset['id'], resource['url']) for dataset in datasets
+                   for resource in dataset['resources']]
+        due = self.schedule.due(entries, now)
+
+        urls = OrderedDict()
+        for dataset_id, url in entries:
+            if (dataset_id, url) in due:
+                urls[canonicalize_url(url)] = True
+
+        results = self.url_cache.get_many(urls.keys())
+
+        urls = [url for url in urls if url not in results]
+        urls = self.scheduler.order(urls)
+        checked = dict(zip(urls, self.map(self.check_url, urls)))
+        self.url_cache.set_many(checked)
+        results.update(checked)
+
+        batch = self.store.batch(self.chunk_size)
+        batch.load([dataset['id'] for dataset in datasets])
+
+        deletes = []
+        for dataset in datasets:
+            deletes.append(self.record_results(dataset, results, batch, due))
+
+        batch.flush()
+
+        outcomes = [(dataset_id, url,
+                     self.working(results[canonicalize_url(url)]))
+                    for dataset_id, url in entries
+                    if (dataset_id, url) in due]
+        self.schedule.reschedule(outcomes, now)
+
+        return deletes
+
+    def record_results(self, dataset, results, batch, due):
         dataset_id = dataset['id']
         delete = False
         portal = None
         if 'extras' in dataset and \
            'metadata_original_portal' in dataset['extras']:
             portal = dataset['extras']['metadata_original_portal']
-	
+
         for resource in dataset['resources']:
             url = resource['url']
-            try:
-                code = self.validate(resource['url'])
-                if self.is_available(code):
-                    self.record_success(dataset_id, url)
-                else:
-                    delete = delete or self.record_failure(dataset, url,
-                                                           code, portal)
-            except requests.exceptions.Timeout:
-                delete = delete or self.record_failure(dataset_id, url,
-                                                       'Timeout', portal)
-            except requests.exceptions.TooManyRedirects:
-                delete = delete or self.record_failure(dataset_id, url,
-                                                       'Redirect Loop', portal)
-            except requests.exceptions.RequestException as e:
-                if e is None:
-                    delete = delete or self.record_failure(dataset_id, url,
-                                                           'Unknown')
-                else:
-                    delete = delete or self.record_failure(dataset_id, url, e)
-            except socket.timeout:
-                delete = delete or self.record_failure(dataset_id, url,
-                                                       'Timeout', portal)
-        
+
+            # Not checked this time, decide based on the recorded strikes
+            if (dataset_id, url) not in due:
+                url_entry = batch.get_url(dataset_id, url)
+                delete = delete or (url_entry is not None and
+                                    url_entry['strikes'] >= 3)
+                continue
+
+            status = results[canonicalize_url(url)]
+            if self.working(status):
+                self.record_success(dataset_id, url, batch=batch)
+            else:
+                delete = delete or self.record_failure(dataset, url, status,
+                                                       portal, batch=batch)
+
         return delete
 
+    def check_url(self, url):
+        """Returns the HTTP status code of the URL or, if the request could
+        not be completed, a short description of the failure."""
+
+        host = host_key(url)
+
+        try:
+            status = self.validate(url)
+        except HostUnreachable:
+            return 'Host Unreachable'
+        except requests.exceptions.TooManyRedirects:
+            status = 'Redirect Loop'
+        except (requests.exceptions.Timeout, socket.timeout):
+            self.breaker.failure(host)
+            return 'Timeout'
+        except requests.exceptions.ConnectionError as e:
+            self.breaker.failure(host)
+            return str(e) or 'Unknown'
+        except requests.exceptions.RequestException as e:
+            return str(e) or 'Unknown'
+
+        self.breaker.success(host)
+        return status
+
+    def map(self, function, items):
+        if self.workers == 1 or len(items) < 2:
+            return map(function, items)
+
+        if self.pool is None:
+            self.pool = ThreadPool(self.workers)
+        return self.pool.map(function, items)
+
+    def close(self):
+        """Stops the worker threads, which are started on first use and
+        shared by all calls of the checker."""
+
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
     def check_dataset(self, dataset):
-        results = []
-        for resource in dataset['resources']:
-            results.append(self.validate(resource['url']))
-        return results
+        urls = [resource['url'] for resource in dataset['resources']]
+        ordered = self.scheduler.order(urls)
+        results = dict(zip(ordered, self.map(self.validate, ordered)))
+        return [results[url] for url in urls]
 
     def validate(self, url):
-        response = requests.head(url, allow_redirects=True,
-                                 timeout=self.TIMEOUT)
+        host = host_key(url)
 
-        if self.is_available(response.status_code):
-            return response.status_code
-        else:
-            response = requests.get(url, allow_redirects=True,
+        with self.scheduler.slot(url):
+            # Checked only now, as the breaker may have opened while waiting
+            if self.breaker.is_open(host):
+                raise HostUnreachable(host)
+
+            if not self.capabilities.supports_head(host):
+                return self.get_status(url)
+
+            response = self.session.head(url, allow_redirects=True,
+                                         timeout=self.TIMEOUT)
+
+            if self.is_available(response.status_code):
+                self.capabilities.learn(host, True)
+                return response.status_code
+
+            status = self.get_status(url)
+            if self.is_available(status):
+                self.capabilities.learn(host, False)
+            return status
+
+    def get_status(self, url):
+        """Sends a GET request, but only reads the response headers. As the
+        body is never read, the connection cannot be kept alive."""
+
+        response = self.session.get(url, allow_redirects=True, stream=True,
+                                    headers={'Connection': 'close'},
                                     timeout=self.TIMEOUT)
-            return response.status_code
+        response.raw.close()
+        response.close()
+        return response.status_code
 
     def is_available(self, response_code):
         return response_code >= 200 and response_code < 300
 
-    def record_failure(self, dataset, url, status, portal,
-                       date=datetime.now().date()):
+    def working(self, status):
+        return isinstance(status, int) and self.is_available(status)
 
-        dataset_id = dataset['id']
-        dataset_name = dataset['name']
+    def record_failure(self, dataset, url, status, portal,
+                       date=datetime.now().date(), batch=None):
 
-        delete = False
-        record = eval(unicode(self.redis_client.get(dataset_id)))
+        if batch is None:
+            batch = self.store.batch(self.chunk_size)
+            delete = self.record_failure(dataset, url, status, portal, date,
+                                         batch)
+            batch.flush()
+            return delete
 
-        initial_url_record = {'status':  status,
-                              'date':    date.strftime("%Y-%m-%d"),
-                              'strikes': 1}
+        dataset_id = dataset['id']
+        if isinstance(date, datetime):
+            date = date.date()
 
-        if record is not None:
-            record['name'] = dataset_name
-            record['metadata_original_portal'] = portal
-            self.redis_client.set(dataset_id, record)
+        batch.set_meta(dataset_id, id=dataset_id, name=dataset['name'],
+                       metadata_original_portal=portal)
 
-        # Record is not known yet
-        if record is None:
-            record = {'id': dataset_id, 'name': dataset_name, 'urls': {}}
-            record['urls'][url] = initial_url_record
-            record['metadata_original_portal'] = portal
-            self.redis_client.set(dataset_id, record)
+        url_entry = batch.get_url(dataset_id, url)
 
-        # Record is known, but not that particular URL (Resource)
-        elif url not in record['urls']:
-            record['urls'][url] = initial_url_record
-            self.redis_client.set(dataset_id, record)
+        # Record or that particular URL (Resource) is not known yet
+        if url_entry is None:
+            strikes = 1
+            batch.set_url(dataset_id, url, status, date.strftime("%Y-%m-%d"),
+                          strikes)
 
         # Record and URL are known, increment Strike counter if 1+ day(s) have
         # passed since the last check
         else:
-            url_entry = record['urls'][url]
+            strikes = url_entry['strikes']
             last_updated = datetime.strptime(url_entry['date'], "%Y-%m-%d")
             last_updated = last_updated.date()
 
             if last_updated < date:
-                url_entry['strikes'] += 1
-                url_entry['date'] = date.strftime("%Y-%m-%d")
-                self.redis_client.set(dataset_id, record)
-
-        delete = record['urls'][url]['strikes'] >= 3
+                strikes = batch.add_strike(dataset_id, url,
+                                           date.strftime("%Y-%m-%d"))
 
-        return delete
+        return strikes >= 3
 
-    def record_success(self, dataset_id, url):
-        record = self.redis_client.get(dataset_id)
-        if record is not None:
-            record = eval(unicode(record))
-            _type= type(record) is dict
-            # Remove URL entry due to working URL
-            if record.get('urls'):
-               record['urls'].pop(url, None)
-            # Remove record entry altogether if there are no failures
-            # anymore
-            if not record.get('urls'):
-                self.redis_client.delete(dataset_id)
-            else:
-                self.redis_client.set(dataset_id, record)
-
-    def get_records(self):
-        result = []
-        for dataset_id in self.redis_client.keys('*'):
-            if dataset_id == 'general':
-                continue
-            result.append(eval(self.redis_client.get(dataset_id)))
+    def record_success(self, dataset_id, url, batch=None):
+        if batch is None:
+            batch = self.store.batch(self.chunk_size)
+            batch.remove_url(dataset_id, url)
+            batch.flush()
+        else:
+            batch.remove_url(dataset_id, url)
 
-        return result
+    def get_records(self, prefix=''):
+        return self.store.records(prefix)
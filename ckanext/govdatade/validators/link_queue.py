@@ -0,0 +1,167 @@
+from redis.exceptions import ResponseError
+
+import json
+import logging
+import os
+import socket
+
+log = logging.getLogger(__name__)
+
+
+def queue_item(dataset):
+    """Reduces a dataset to the fields the link checker needs."""
+
+    portal = None
+    if 'extras' in dataset and \
+       'metadata_original_portal' in dataset['extras']:
+        portal = dataset['extras']['metadata_original_portal']
+
+    return {'id':        dataset['id'],
+            'name':      dataset['name'],
+            'extras':    {'metadata_original_portal': portal},
+            'resources': [{'url': resource['url']}
+                          for resource in dataset['resources']]}
+
+
+def default_consumer():
+    return '%s-%s' % (socket.gethostname(), os.getpid())
+
+
+def parse_entries(entries):
+    """Converts stream entries [id, [field, value, ...]] into (id, dataset)
+    pairs. Entries deleted in the meantime are returned as (id, None)."""
+
+    result = []
+    for entry in entries or []:
+        if entry is None:
+            continue
+
+        message_id, fields = entry
+        if not fields:
+            result.append((message_id, None))
+            continue
+
+        fields = dict(zip(fields[::2], fields[1::2]))
+        result.append((message_id, json.loads(fields['dataset'])))
+
+    return result
+
+
+class LinkQueue(object):
+    """Queue of datasets whose URLs are still to be checked, kept in a Redis
+    stream (Redis >= 5.0). Workers on any number of nodes read from one
+    consumer group, so that every dataset is delivered to one worker. Items
+    are deleted once acknowledged. Items a worker claimed but did not
+    acknowledge within claim_timeout seconds are handed to the next worker
+    asking for items, up to max_deliveries times.
+
+    redis-py does not know the stream commands yet, so they are sent with
+    execute_command."""
+
+    KEY = 'linkchecker:stream'
+    GROUP = 'linkchecker'
+
+    def __init__(self, redis_client, consumer=None, claim_timeout=600,
+                 max_deliveries=5):
+        self.redis_client = redis_client
+        self.consumer = consumer or default_consumer()
+        self.claim_timeout = claim_timeout
+        self.max_deliveries = max_deliveries
+        self.group_created = False
+
+    def __len__(self):
+        """Returns the number of items not acknowledged yet."""
+        return self.redis_client.execute_command('XLEN', self.KEY)
+
+    def create_group(self):
+        if self.group_created:
+            return
+
+        try:
+            self.redis_client.execute_command('XGROUP', 'CREATE', self.KEY,
+                                              self.GROUP, '0', 'MKSTREAM')
+        except ResponseError as e:
+            if not str(e).startswith('BUSYGROUP'):
+                raise
+
+        self.group_created = True
+
+    def push(self, dataset):
+        self.push_many([dataset])
+
+    def push_many(self, datasets):
+        self.create_group()
+
+        pipeline = self.redis_client.pipeline(transaction=False)
+        for dataset in datasets:
+            pipeline.execute_command('XADD', self.KEY, '*', 'dataset',
+                                     json.dumps(queue_item(dataset)))
+        pipeline.execute()
+
+    def claim(self, count, block=0):
+        """Returns up to count (message id, dataset) pairs, preferring stale
+        items of other workers over new ones. Waits at most block seconds
+        for new items if there are none."""
+
+        self.create_group()
+
+        items = self.claim_stale(count)
+        if len(items) < count:
+            items.extend(self.read(count - len(items), block))
+        return items
+
+    def read(self, count, block=0):
+        command = ['XREADGROUP', 'GROUP', self.GROUP, self.consumer,
+                   'COUNT', count]
+        if block:
+            command.extend(['BLOCK', int(block * 1000)])
+        command.extend(['STREAMS', self.KEY, '>'])
+
+        streams = self.redis_client.execute_command(*command)
+        if not streams:
+            return []
+
+        key, entries = streams[0]
+        return parse_entries(entries)
+
+    def claim_stale(self, count):
+        pending = self.redis_client.execute_command('XPENDING', self.KEY,
+                                                    self.GROUP, '-', '+',
+                                                    count)
+        min_idle = self.claim_timeout * 1000
+
+        stale = []
+        dropped = []
+        for message_id, consumer, idle, deliveries in pending:
+            if idle < min_idle:
+                continue
+            if deliveries >= self.max_deliveries:
+                log.warning('Dropping %s after %s deliveries'
+                            % (message_id, deliveries))
+                dropped.append(message_id)
+            else:
+                stale.append(message_id)
+
+        self.ack(dropped)
+        if not stale:
+            return []
+
+        entries = self.redis_client.execute_command('XCLAIM', self.KEY,
+                                                    self.GROUP, self.consumer,
+                                                    min_idle, *stale)
+        items = parse_entries(entries)
+
+        # Items which were claimed, but deleted meanwhile
+        self.ack([message_id for message_id, dataset in items
+                  if dataset is None])
+        return [(message_id, dataset) for message_id, dataset in items
+                if dataset is not None]
+
+    def ack(self, message_ids):
+        if not message_ids:
+            return
+
+        pipeline = self.redis_client.pipeline(transaction=True)
+        pipeline.execute_command('XACK', self.KEY, self.GROUP, *message_ids)
+        pipeline.execute_command('XDEL', self.KEY, *message_ids)
+        pipeline.execute()
@@ -0,0 +1,63 @@
+class LinkSchedule(object):
+    """Keeps the time at which every URL of a dataset is due for its next
+    check in a Redis sorted set. Working URLs are checked again after
+    healthy_interval seconds, broken ones already after failing_interval
+    seconds, so that their strikes keep accumulating. A healthy_interval
+    of 0 disables the schedule, i.e. every URL is always due."""
+
+    KEY = 'linkchecker:schedule'
+
+    def __init__(self, redis_client, healthy_interval, failing_interval):
+        self.redis_client = redis_client
+        self.healthy_interval = healthy_interval
+        self.failing_interval = failing_interval
+
+    @property
+    def enabled(self):
+        return self.healthy_interval > 0
+
+    def member(self, dataset_id, url):
+        return u'%s %s' % (dataset_id, url)
+
+    def parse_member(self, member):
+        dataset_id, url = member.decode('utf-8').split(' ', 1)
+        return dataset_id, url
+
+    def due(self, entries, now):
+        """Returns the subset of the (dataset id, URL) entries which are due
+        at time now. Entries which have never been checked are due."""
+
+        entries = list(entries)
+        if not self.enabled or not entries:
+            return set(entries)
+
+        pipeline = self.redis_client.pipeline(transaction=False)
+        for dataset_id, url in entries:
+            pipeline.zscore(self.KEY, self.member(dataset_id, url))
+
+        return set(entry for entry, score in zip(entries, pipeline.execute())
+                   if score is None or score <= now)
+
+    def reschedule(self, outcomes, now):
+        """Schedules the next check of (dataset id, URL, working) outcomes."""
+
+        if not self.enabled or not outcomes:
+            return
+
+        scores = []
+        for dataset_id, url, working in outcomes:
+            interval = self.healthy_interval if working else \
+                self.failing_interval
+            scores.extend([now + interval, self.member(dataset_id, url)])
+
+        self.redis_client.zadd(self.KEY, *scores)
+
+    def next_due(self, now, limit):
+        members = self.redis_client.zrangebyscore(self.KEY, '-inf', now,
+                                                  start=0, num=limit)
+        return [self.parse_member(member) for member in members]
+
+    def remove(self, entries):
+        members = [self.member(dataset_id, url) for dataset_id, url in entries]
+        if members:
+            self.redis_client.zrem(self.KEY, *members)
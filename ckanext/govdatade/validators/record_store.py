@@ -0,0 +1,301 @@
+import ast
+import json
+import re
+
+
+URL_FIELDS = ('status', 'date', 'strikes')
+
+
+def escape_pattern(value):
+    return re.sub(r'([*?\[\]\\])', r'\\\1', value)
+
+
+def scan_keys(redis_client, match, count):
+    """Iterates over the keys matching the glob pattern in lists of roughly
+    count keys. Unlike KEYS, SCAN does not block the server, but it may
+    return a key more than once if the key space is resized meanwhile."""
+
+    cursor = 0
+    while True:
+        cursor, keys = redis_client.execute_command('SCAN', cursor,
+                                                    'MATCH', match,
+                                                    'COUNT', count)
+        if keys:
+            yield keys
+        if int(cursor) == 0:
+            break
+
+
+def url_field(name, url):
+    return u'%s:%s' % (name, url)
+
+
+def encode_url_entry(url, status, date, strikes):
+    return {url_field('status', url):  json.dumps(status),
+            url_field('date', url):    date,
+            url_field('strikes', url): strikes}
+
+
+def decode_url_value(name, value):
+    if name == 'strikes':
+        return int(value)
+    elif name == 'date':
+        return value
+    else:
+        return json.loads(value)
+
+
+def decode_record(fields):
+    """Converts the fields of a record hash into the record dict consumed by
+    the report, i.e. {'id': ..., 'urls': {url: {'status': ..., 'date': ...,
+    'strikes': ...}}, ...}."""
+
+    record = {}
+    urls = {}
+
+    for field, value in fields.iteritems():
+        field = field.decode('utf-8')
+        name, separator, url = field.partition(':')
+
+        if separator and name in URL_FIELDS:
+            urls.setdefault(url, {})[name] = decode_url_value(name, value)
+        else:
+            record[field] = json.loads(value)
+
+    if urls:
+        record['urls'] = urls
+
+    return record
+
+
+def encode_record(record):
+    fields = {}
+    for key, value in record.iteritems():
+        if key != 'urls':
+            fields[key] = json.dumps(value)
+
+    for url, entry in record.get('urls', {}).iteritems():
+        fields.update(encode_url_entry(url, entry['status'], entry['date'],
+                                       entry['strikes']))
+    return fields
+
+
+class RecordStore(object):
+    """Keeps the link and schema checker results of a dataset in one Redis
+    hash. Dataset attributes are JSON encoded fields, the state of every
+    broken URL is spread over the fields status:<url>, date:<url> and
+    strikes:<url>, so that single values can be updated in place."""
+
+    PREFIX = 'record:'
+    GENERAL = 'general'
+
+    def __init__(self, redis_client, scan_count=500):
+        self.redis_client = redis_client
+        self.scan_count = scan_count
+
+    def key(self, dataset_id):
+        return u'%s%s' % (self.PREFIX, dataset_id)
+
+    def get(self, dataset_id):
+        fields = self.redis_client.hgetall(self.key(dataset_id))
+        if not fields:
+            return None
+        return decode_record(fields)
+
+    def get_many(self, dataset_ids):
+        pipeline = self.redis_client.pipeline(transaction=False)
+        for dataset_id in dataset_ids:
+            pipeline.hgetall(self.key(dataset_id))
+
+        return [decode_record(fields) if fields else None
+                for fields in pipeline.execute()]
+
+    def records(self, prefix=''):
+        """Iterates over the records of all datasets whose id starts with
+        prefix, fetching one pipelined batch of records per SCAN step.
+        Keys returned again by SCAN are skipped."""
+
+        seen = set()
+        match = escape_pattern(self.key(prefix)) + '*'
+        for keys in scan_keys(self.redis_client, match, self.scan_count):
+            keys = [key for key in keys if key not in seen]
+            seen.update(keys)
+            if not keys:
+                continue
+
+            pipeline = self.redis_client.pipeline(transaction=False)
+            for key in keys:
+                pipeline.hgetall(key)
+
+            for fields in pipeline.execute():
+                if fields:
+                    yield decode_record(fields)
+
+    def batch(self, chunk_size):
+        return RecordBatch(self, chunk_size)
+
+    def get_general(self):
+        general = self.redis_client.get(self.GENERAL)
+        if general is None:
+            return None
+        return json.loads(general)
+
+    def set_general(self, general):
+        self.redis_client.set(self.GENERAL, json.dumps(general))
+
+
+class RecordBatch(object):
+    """Buffers record updates in a Redis pipeline, which is sent as one
+    MULTI/EXEC transaction every chunk_size commands and on flush. Records
+    are read at most once per batch and loaded records are updated locally
+    along with every queued command, so reads within a batch see the writes
+    of the batch."""
+
+    def __init__(self, store, chunk_size):
+        self.store = store
+        self.chunk_size = max(1, chunk_size)
+        self.records = {}
+        self.pipeline = None
+        self.commands = 0
+
+    def load(self, dataset_ids):
+        missing = []
+        for dataset_id in dataset_ids:
+            if dataset_id not in self.records and dataset_id not in missing:
+                missing.append(dataset_id)
+
+        if missing:
+            # Queued writes have to reach Redis before records are read
+            self.flush()
+            records = self.store.get_many(missing)
+            self.records.update(zip(missing, records))
+
+    def get(self, dataset_id):
+        self.load([dataset_id])
+        return self.records[dataset_id]
+
+    def get_url(self, dataset_id, url):
+        record = self.get(dataset_id)
+        if record is None:
+            return None
+        return record.get('urls', {}).get(url)
+
+    def set_meta(self, dataset_id, **attributes):
+        record = self.cached(dataset_id)
+        if record is not None:
+            record.update(attributes)
+
+        fields = dict((name, json.dumps(value))
+                      for name, value in attributes.iteritems())
+        self.queue().hmset(self.store.key(dataset_id), fields)
+
+    def set_meta_default(self, dataset_id, name, value):
+        record = self.cached(dataset_id)
+        if record is not None:
+            record.setdefault(name, value)
+        self.queue().hsetnx(self.store.key(dataset_id), name,
+                            json.dumps(value))
+
+    def set_url(self, dataset_id, url, status, date, strikes):
+        record = self.cached(dataset_id)
+        if record is not None:
+            entry = {'status': status, 'date': date, 'strikes': strikes}
+            record.setdefault('urls', {})[url] = entry
+
+        fields = encode_url_entry(url, status, date, strikes)
+        self.queue().hmset(self.store.key(dataset_id), fields)
+
+    def add_strike(self, dataset_id, url, date):
+        entry = self.get_url(dataset_id, url)
+        entry['strikes'] += 1
+        entry['date'] = date
+
+        key = self.store.key(dataset_id)
+        self.queue().hincrby(key, url_field('strikes', url), 1)
+        self.queue().hset(key, url_field('date', url), date)
+        return entry['strikes']
+
+    def remove_url(self, dataset_id, url):
+        if self.get_url(dataset_id, url) is None:
+            return
+
+        record = self.records[dataset_id]
+        del record['urls'][url]
+
+        # Remove the record altogether if it holds no results anymore
+        key = self.store.key(dataset_id)
+        if not record['urls'] and 'schema' not in record:
+            self.records[dataset_id] = None
+            self.queue().delete(key)
+        else:
+            fields = [url_field(name, url) for name in URL_FIELDS]
+            self.queue().hdel(key, *fields)
+
+    def cached(self, dataset_id):
+        """Returns the local copy of a loaded record, which is created if the
+        record does not exist yet, or None if the record was not loaded."""
+
+        if dataset_id not in self.records:
+            return None
+        if self.records[dataset_id] is None:
+            self.records[dataset_id] = {}
+        return self.records[dataset_id]
+
+    def queue(self):
+        if self.commands >= self.chunk_size:
+            self.flush()
+
+        if self.pipeline is None:
+            self.pipeline = self.store.redis_client.pipeline(transaction=True)
+
+        self.commands += 1
+        return self.pipeline
+
+    def flush(self):
+        if self.pipeline is not None:
+            self.pipeline.execute()
+
+        self.pipeline = None
+        self.commands = 0
+
+
+# Key namespaces of the current version, never holding records to migrate
+NAMESPACES = ('record:', 'linkchecker:', 'fingerprint:')
+
+
+def migrate_records(redis_client):
+    """Converts records stored as Python dict reprs into record hashes.
+    Returns the number of migrated keys and the keys which could not be
+    parsed."""
+
+    store = RecordStore(redis_client)
+    migrated = 0
+    failed = []
+
+    keys = (key for batch in scan_keys(redis_client, '*', store.scan_count)
+            for key in batch)
+
+    for key in keys:
+        if key.startswith(NAMESPACES) or redis_client.type(key) != 'string':
+            continue
+
+        try:
+            record = ast.literal_eval(redis_client.get(key))
+        except (SyntaxError, ValueError):
+            failed.append(key)
+            continue
+
+        pipeline = redis_client.pipeline()
+        if key == RecordStore.GENERAL:
+            pipeline.set(key, json.dumps(record))
+        elif isinstance(record, dict) and 'id' in record:
+            pipeline.delete(key)
+            pipeline.hmset(store.key(record['id']), encode_record(record))
+        else:
+            failed.append(key)
+            continue
+
+        pipeline.execute()
+        migrated += 1
+
+    return migrated, failed
@@ -0,0 +1,55 @@
+from ckanext.govdatade import CONFIG
+from ckanext.govdatade.validators.record_store import RecordStore
+from redis.connection import UnixDomainSocketConnection
+
+import redis
+import threading
+
+
+_pools = {}
+_lock = threading.Lock()
+
+
+def create_pool(database):
+    """Creates a connection pool as configured in the [redis] section. The
+    pool holds at most max_connections connections. When all of them are
+    in use, callers wait up to pool_timeout seconds for a free one."""
+
+    kwargs = {'db':              database,
+              'max_connections': CONFIG.getint('redis', 'max_connections'),
+              'timeout':         CONFIG.getint('redis', 'pool_timeout')}
+
+    socket_timeout = CONFIG.getfloat('redis', 'socket_timeout')
+    if socket_timeout > 0:
+        kwargs['socket_timeout'] = socket_timeout
+
+    unix_socket_path = CONFIG.get('redis', 'unix_socket_path')
+    if unix_socket_path:
+        kwargs['connection_class'] = UnixDomainSocketConnection
+        kwargs['path'] = unix_socket_path
+    else:
+        kwargs['host'] = CONFIG.get('redis', 'host')
+        kwargs['port'] = CONFIG.getint('redis', 'port')
+
+    return redis.BlockingConnectionPool(**kwargs)
+
+
+def get_redis_client(db='production'):
+    """Returns a client using the process-wide connection pool of the
+    production or the test database."""
+
+    databases = {'production': CONFIG.getint('redis', 'db'),
+                 'test':       CONFIG.getint('redis', 'test_db')}
+    database = databases[db]
+
+    with _lock:
+        if database not in _pools:
+            _pools[database] = create_pool(database)
+        pool = _pools[database]
+
+    return redis.StrictRedis(connection_pool=pool)
+
+
+def get_record_store(db='production'):
+    scan_count = CONFIG.getint('validators', 'scan_count')
+    return RecordStore(get_redis_client(db), scan_count)
@@ -1,58 +1,133 @@
+from ckanext.govdatade import CONFIG
+from ckanext.govdatade.registry import get_schema
+from ckanext.govdatade.validators.redis_pool import get_record_store
+from ckanext.govdatade.validators.redis_pool import get_redis_client
 from jsonschema.validators import Draft3Validator
 
+import hashlib
 import json
-import urllib2
-import redis
+import threading
 
 
-class SchemaChecker:
+_validators = {}
+_lock = threading.Lock()
 
-    SCHEMA_URL = 'https://raw.github.com/fraunhoferfokus/ogd-metadata/master/OGPD_JSON_Schema.json'  # NOQA
 
-    def __init__(self, db='production'):
-        redis_db_dict = {'production': 0, 'test': 1}
-        database = redis_db_dict[db]
-        self.schema = json.loads(urllib2.urlopen(self.SCHEMA_URL).read())
-        self.redis_client = redis.StrictRedis(host='localhost',
-                                              port=6379,
-                                              db=database)
-
-    def process_record(self, dataset):
-        dataset_id = dataset['id']
-        record = self.redis_client.get(dataset_id)
+def canonical_hash(value):
+    return hashlib.sha1(json.dumps(value, sort_keys=True,
+                                   separators=(',', ':'))).hexdigest()
 
-        portal = dataset['extras'].get('metadata_original_portal', 'null')
 
-        if record is None:
-            record = {'id': dataset_id, 'metadata_original_portal': portal}
-        else:
-            record = eval(record)
+def schema_version(schema):
+    return canonical_hash(schema)
+
+
+def dataset_fingerprint(dataset):
+    """Hashes the content of a normalized dataset. The tracking summary is
+    left out, as it changes with every page view."""
+
+    content = dict((key, value) for key, value in dataset.iteritems()
+                   if key != 'tracking_summary')
+    return canonical_hash(content)
+
+
+def schema_validator(schema):
+    """Returns a validator for the schema, which is created once per schema
+    version and shared afterwards."""
+
+    version = schema_version(schema)
+    with _lock:
+        if version not in _validators:
+            _validators[version] = Draft3Validator(schema)
+        return _validators[version]
 
-        record['schema'] = []
-        broken_rules = []
 
-        errors = Draft3Validator(self.schema).iter_errors(dataset)
+def broken_rules(validator, dataset, separator='.'):
+    """Validates the dataset in a single pass. Returns the broken rules as
+    [path, message] pairs, i.e. an empty list for a valid dataset."""
+
+    rules = []
+    for error in validator.iter_errors(dataset):
+        path = [e for e in error.path if isinstance(e, basestring)]
+        path = str(separator.join(map((lambda e: str(e)), path)))
+        rules.append([path, error.message])
+
+    return rules
+
+
+class SchemaChecker(object):
+    """Validates datasets against the OGPD schema of the registry. The
+    schema is loaded on first use, and again whenever the registry has
+    refreshed it."""
+
+    def __init__(self, db='production'):
+        self.redis_client = get_redis_client(db)
+        self.store = get_record_store(db)
+        self.chunk_size = CONFIG.getint('validators', 'write_chunk_size')
+        self.loaded_schema = None
+
+    def load_schema(self):
+        schema = get_schema()
+        if schema is not self.loaded_schema:
+            self._validator = schema_validator(schema)
+            self._schema_version = schema_version(schema)
+            self.loaded_schema = schema
+
+    @property
+    def schema(self):
+        self.load_schema()
+        return self.loaded_schema
+
+    @property
+    def validator(self):
+        self.load_schema()
+        return self._validator
+
+    @property
+    def schema_version(self):
+        self.load_schema()
+        return self._schema_version
+
+    def process_record(self, dataset, batch=None, full=False):
+        """Validates the dataset unless it is unchanged since it was last
+        validated against the same schema, in which case the recorded
+        result is kept. full forces the validation."""
+
+        if batch is None:
+            batch = self.store.batch(self.chunk_size)
+            valid = self.process_record(dataset, batch, full)
+            batch.flush()
+            return valid
+
+        dataset_id = dataset['id']
+        portal = dataset['extras'].get('metadata_original_portal', 'null')
+        fingerprint = dataset_fingerprint(dataset)
 
-        if not Draft3Validator(self.schema).is_valid(dataset):
-            errors = Draft3Validator(self.schema).iter_errors(dataset)
+        if not full and \
+           self.known_fingerprint(dataset_id, batch) == fingerprint:
+            return not batch.get(dataset_id)['schema']
 
-            for error in errors:
-                path = [e for e in error.path if isinstance(e, basestring)]
-                path = str('.'.join(map((lambda e: str(e)), path)))
+        rules = broken_rules(self.validator, dataset)
+        self.record_rules(dataset_id, portal, rules, batch, fingerprint)
 
-                field_path_message = [path, error.message]
-                broken_rules.append(field_path_message)
+        return not rules
 
-        record['schema'] = broken_rules
-        self.redis_client.set(dataset_id, record)
+    def known_fingerprint(self, dataset_id, batch):
+        """Returns the fingerprint of the dataset as last validated against
+        the current schema, or None."""
 
-        return not broken_rules
+        record = batch.get(dataset_id)
+        if record is None or 'schema' not in record or \
+           record.get('schema_version') != self.schema_version:
+            return None
+        return record.get('fingerprint')
 
-    def get_records(self):
-        result = []
-        for dataset_id in self.redis_client.keys('*'):
-            if dataset_id == 'general':
-                continue
-            result.append(eval(self.redis_client.get(dataset_id)))
+    def record_rules(self, dataset_id, portal, rules, batch,
+                     fingerprint=None):
+        batch.set_meta_default(dataset_id, 'metadata_original_portal', portal)
+        batch.set_meta(dataset_id, id=dataset_id, schema=rules,
+                       fingerprint=fingerprint,
+                       schema_version=self.schema_version)
 
-        return result
+    def get_records(self, prefix=''):
+        return self.store.records(prefix)
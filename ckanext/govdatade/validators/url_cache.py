@@ -0,0 +1,79 @@
+import json
+import urlparse
+
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+def canonicalize_url(url):
+    """Lower-cases scheme and host, strips the default port and drops the
+    fragment. URLs which cannot be parsed are returned unchanged."""
+
+    try:
+        parts = urlparse.urlsplit(url.strip())
+        port = parts.port
+    except ValueError:
+        return url
+
+    scheme = parts.scheme.lower()
+    netloc = (parts.hostname or '').lower()
+
+    if ':' in netloc:  # IPv6 address
+        netloc = '[%s]' % netloc
+
+    if port and port != DEFAULT_PORTS.get(scheme):
+        netloc = '%s:%s' % (netloc, port)
+
+    if parts.username is not None:
+        userinfo = parts.username
+        if parts.password is not None:
+            userinfo = '%s:%s' % (userinfo, parts.password)
+        netloc = '%s@%s' % (userinfo, netloc)
+
+    path = parts.path
+    if netloc and not path:
+        path = '/'
+
+    return urlparse.urlunsplit((scheme, netloc, path, parts.query, ''))
+
+
+class URLCache(object):
+    """Caches link check results per canonical URL for ttl seconds. As the
+    entries are kept in Redis, they are shared by all datasets and worker
+    processes of a run. A ttl of 0 disables the cache.
+
+    Failures without an HTTP status, like timeouts or unreachable hosts, are
+    often transient and are only cached for failure_ttl seconds."""
+
+    PREFIX = 'linkchecker:url:'
+
+    def __init__(self, redis_client, ttl, failure_ttl=0):
+        self.redis_client = redis_client
+        self.ttl = ttl
+        self.failure_ttl = min(failure_ttl, ttl)
+
+    def key(self, url):
+        return self.PREFIX + canonicalize_url(url)
+
+    def get_many(self, urls):
+        if not self.ttl or not urls:
+            return {}
+
+        values = self.redis_client.mget([self.key(url) for url in urls])
+
+        result = {}
+        for url, value in zip(urls, values):
+            if value is not None:
+                result[url] = json.loads(value)
+        return result
+
+    def set_many(self, results):
+        if not self.ttl or not results:
+            return
+
+        pipeline = self.redis_client.pipeline(transaction=False)
+        for url, status in results.iteritems():
+            ttl = self.ttl if isinstance(status, int) else self.failure_ttl
+            if ttl:
+                pipeline.setex(self.key(url), ttl, json.dumps(status))
+        pipeline.execute()
@@ -44,6 +44,7 @@ setup(
     schemachecker = ckanext.govdatade.commands.schema_checker:SchemaChecker
     linkchecker = ckanext.govdatade.commands.link_checker:LinkChecker
     report = ckanext.govdatade.commands.report:Report
+    registry = ckanext.govdatade.commands.registry:Registry
 
     [nose.plugins]
     pylons = pylons.test:PylonsPlugin